@@ -0,0 +1,110 @@
+"""Compare PlantUML render latency and failure rate per layout engine (Graphviz dot, Smetana, ELK).
+
+Usage (from the repository root, with java on the PATH):
+    python benchmarks/layout_engine_benchmark.py [--jar plantuml.jar] [diagram.puml ...]
+
+Without diagram files, the examples in data.py are rendered, plus synthetic class and
+component diagrams large enough for the layout to dominate the render time. Each diagram
+is rendered once per engine to warm the JVM, then timed over REPEATS renders; the median
+is reported. Results are per diagram and summed per engine, so defaults can be set per
+diagram type with PLANTUML_LAYOUT_ENGINES.
+"""
+import argparse
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from data import diagrams  # noqa: E402
+from plantuml_renderer import PlantUMLError, RenderPool, RenderWorkerError  # noqa: E402
+from plantuml_syntax import with_layout_engine  # noqa: E402
+
+REPEATS = 5
+ENGINES = {"dot": None, "smetana": "smetana", "elk": "elk"}
+DIAGRAM_PATTERN = re.compile(r"@start\w+.*?@end\w+", re.DOTALL)
+
+
+def synthetic_class_diagram(classes=60):
+    lines = ["@startuml"]
+    for index in range(classes):
+        lines.append(f"class Class{index} {{\n  +id : int\n  +name : String\n  +update()\n}}")
+    for index in range(1, classes):
+        lines.append(f"Class{index // 3} <|-- Class{index}" if index % 2 else f"Class{index - 1} --> Class{index}")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def synthetic_component_diagram(packages=8, components=6):
+    lines = ["@startuml"]
+    for package in range(packages):
+        lines.append(f'package "Package {package}" {{')
+        lines += [f"  [Component {package}.{index}]" for index in range(components)]
+        lines.append("}")
+    for package in range(1, packages):
+        for index in range(components):
+            lines.append(f"[Component {package}.{index}] --> [Component {package - 1}.{(index + 1) % components}]")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def benchmark_diagrams(paths):
+    if paths:
+        return {Path(path).name: Path(path).read_text(encoding="utf-8") for path in paths}
+    examples = {}
+    for diagram in diagrams:
+        match = DIAGRAM_PATTERN.search(diagram["example"])
+        if match:  # skip placeholder examples that are not complete diagrams
+            examples[diagram["diagram_type"]] = match.group(0)
+    examples["Synthetic class diagram (60 classes)"] = synthetic_class_diagram()
+    examples["Synthetic component diagram (48 components)"] = synthetic_component_diagram()
+    return examples
+
+
+def measure(pool, code):
+    """Return (median seconds, error message); the error is None when every render succeeded."""
+    timings = []
+    try:
+        pool.render(code)  # warm-up
+        for _ in range(REPEATS):
+            start_time = time.perf_counter()
+            pool.render(code)
+            timings.append(time.perf_counter() - start_time)
+    except (PlantUMLError, RenderWorkerError) as e:
+        return None, str(e)
+    return statistics.median(timings), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jar", default=str(Path(__file__).resolve().parent.parent / "plantuml.jar"))
+    parser.add_argument("diagrams", nargs="*", help="PlantUML files to benchmark instead of the built-in set")
+    args = parser.parse_args()
+
+    examples = benchmark_diagrams(args.diagrams)
+    pool = RenderPool(args.jar, formats=("png",), workers_per_format=1)
+    totals = {engine: [0.0, 0] for engine in ENGINES}  # engine -> [seconds, failures]
+    try:
+        print(f"{'diagram':<48}" + "".join(f"{engine:>14}" for engine in ENGINES))
+        for name, code in examples.items():
+            row = f"{name[:47]:<48}"
+            for engine, pragma in ENGINES.items():
+                seconds, error = measure(pool, with_layout_engine(code, pragma))
+                if error:
+                    totals[engine][1] += 1
+                    row += f"{'failed':>14}"
+                else:
+                    totals[engine][0] += seconds
+                    row += f"{seconds * 1000:>11.1f} ms"
+            print(row)
+    finally:
+        pool.close()
+
+    print(f"\n{'engine':<10}{'total median ms':>18}{'failures':>12}")
+    for engine, (seconds, failures) in totals.items():
+        print(f"{engine:<10}{seconds * 1000:>18.1f}{f'{failures}/{len(examples)}':>12}")
+
+
+if __name__ == "__main__":
+    main()
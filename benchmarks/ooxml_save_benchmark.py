@@ -0,0 +1,121 @@
+"""Compare save time and output size of the library OOXML saves against ooxml_save.save_ooxml.
+
+Usage (from the repository root):
+    python benchmarks/ooxml_save_benchmark.py [file.pptx|file.docx|file.xlsx ...]
+
+Without arguments a synthetic media-heavy deck (20 image slides), document (10 images)
+and workbook (2000 rows, 5 images) are generated.
+"""
+import os
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from docx import Document
+from docx.shared import Inches
+from openpyxl import Workbook, load_workbook
+from openpyxl.drawing.image import Image as XlsxImage
+from PIL import Image
+from pptx import Presentation
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ooxml_save import save_ooxml  # noqa: E402
+
+REPEATS = 3
+COMPRESSLEVELS = [1, 6]
+
+
+def noise_image(fmt, size=(1600, 1200)):
+    image = Image.frombytes("RGB", size, os.urandom(size[0] * size[1] * 3))
+    output = BytesIO()
+    image.save(output, format=fmt)
+    output.seek(0)
+    return output
+
+
+def synthetic_pptx(slides=20):
+    ppt = Presentation()
+    for index in range(slides):
+        slide = ppt.slides.add_slide(ppt.slide_layouts[5])
+        slide.shapes.title.text = f"Slide {index + 1}"
+        slide.shapes.add_picture(noise_image("JPEG" if index % 2 else "PNG"), 0, 0)
+    return ppt
+
+
+def synthetic_docx(images=10):
+    doc = Document()
+    for index in range(images):
+        doc.add_paragraph(f"Section {index + 1} " + "lorem ipsum dolor sit amet " * 50)
+        doc.add_picture(noise_image("JPEG"), width=Inches(6))
+    return doc
+
+
+def synthetic_xlsx(images=5):
+    wb = Workbook()
+    sheet = wb.active
+    for row in range(1, 2001):
+        sheet.append([f"Item {row}", "description " * 5, row])
+    for index in range(images):
+        sheet.add_image(XlsxImage(noise_image("PNG")), f"E{index * 30 + 1}")
+    return wb
+
+
+def loader_for(name):
+    suffix = Path(name).suffix.lower()
+    if suffix == ".pptx":
+        return Presentation
+    if suffix == ".docx":
+        return Document
+    if suffix == ".xlsx":
+        return load_workbook
+    raise ValueError(f"Unsupported file: {name}")
+
+
+def to_bytes(document):
+    output = BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def measure(load, save):
+    # Documents are reloaded for every run because openpyxl images can only be saved once
+    best_seconds, size = None, 0
+    for _ in range(REPEATS):
+        document = load()
+        output = BytesIO()
+        start_time = time.perf_counter()
+        save(document, output)
+        elapsed = time.perf_counter() - start_time
+        best_seconds = elapsed if best_seconds is None else min(best_seconds, elapsed)
+        size = output.tell()
+    return best_seconds, size
+
+
+def benchmark(name, data):
+    loader = loader_for(name)
+
+    def load():
+        return loader(BytesIO(data))
+
+    baseline_seconds, baseline_size = measure(load, lambda document, output: document.save(output))
+    print(f"\n{name}")
+    print(f"  {'library save':<24} {baseline_seconds * 1000:8.1f} ms {baseline_size / 1024:10.1f} KiB")
+    for level in COMPRESSLEVELS:
+        seconds, size = measure(load, lambda document, output: save_ooxml(document, output, level))
+        print(f"  {f'save_ooxml level={level}':<24} {seconds * 1000:8.1f} ms {size / 1024:10.1f} KiB"
+              f"   ({baseline_seconds / seconds:.1f}x faster, {size / baseline_size - 1:+.1%} size)")
+
+
+def main():
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            benchmark(path, Path(path).read_bytes())
+    else:
+        benchmark("synthetic_deck.pptx", to_bytes(synthetic_pptx()))
+        benchmark("synthetic_document.docx", to_bytes(synthetic_docx()))
+        benchmark("synthetic_workbook.xlsx", to_bytes(synthetic_xlsx()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare end-to-end latency and render success of the two planning modes of the diagram page.
+
+Usage (from the repository root, with java on the PATH and .streamlit/secrets.toml set up):
+    python benchmarks/planning_mode_benchmark.py [--repeats 3] [instructions.txt]
+
+Each instruction (one per line in the file, or a built-in set) is run through
+pages/diagram_agent.py with "Plan, then code" (a plan request followed by a code request)
+and with "Plan and code in one request", alternating the order per repeat. A run is timed
+from the button click until the page has finished, including retries, and counts as a
+success when the page reports a generated diagram. The instruction cache is turned off so
+every run calls Azure OpenAI.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+PAGE = ROOT / "pages" / "diagram_agent.py"
+MODES = {"Plan, then code": False, "Plan and code in one request": True}
+SUCCESS_TOAST = "Successfully generated your diagram"
+INSTRUCTIONS = [
+    "Explain how Bitcoin works",
+    "A customer orders a book online, pays by card and receives a shipping confirmation email",
+    "Classes for a library system with books, members, loans and reservations",
+    "The states of a support ticket from creation to closure, including reopening",
+    "Components of a web shop: frontend, API gateway, order service, payment service and database",
+]
+
+
+def widget(widgets, label):
+    return next(element for element in widgets if element.label == label)
+
+
+def run_once(app, instruction, single_call):
+    """Return (seconds, diagram shown) for one click of "Generate diagram"."""
+    widget(app.sidebar.toggle, "Enable Planning Mode").set_value(True)
+    widget(app.sidebar.toggle, "Plan and code in one request").set_value(single_call)
+    widget(app.sidebar.toggle, "Reuse results for repeated requests").set_value(False)
+    app.text_area[0].set_value(instruction)
+    widget(app.button, "Generate diagram").click()
+    start_time = time.perf_counter()
+    app.run()
+    seconds = time.perf_counter() - start_time
+    return seconds, not app.exception and any(toast.value == SUCCESS_TOAST for toast in app.toast)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("instructions", nargs="?", help="Text file with one instruction per line")
+    args = parser.parse_args()
+
+    instructions = INSTRUCTIONS
+    if args.instructions:
+        instructions = [line.strip() for line in Path(args.instructions).read_text(encoding="utf-8").splitlines()
+                        if line.strip()]
+
+    app = AppTest.from_file(str(PAGE), default_timeout=600)
+    app.run()
+    if app.exception:
+        sys.exit(f"The page failed to run: {app.exception[0].message}")
+
+    results = {mode: [] for mode in MODES}  # mode -> [(seconds, succeeded)]
+    for repeat in range(args.repeats):
+        # Alternate which mode goes first so drift in service latency affects both alike
+        modes = list(MODES.items()) if repeat % 2 == 0 else list(reversed(MODES.items()))
+        for instruction in instructions:
+            for mode, single_call in modes:
+                seconds, succeeded = run_once(app, instruction, single_call)
+                results[mode].append((seconds, succeeded))
+                print(f"{mode:<30}{seconds:>8.1f} s  {'ok' if succeeded else 'failed':<8}{instruction[:60]}")
+
+    print(f"\n{'mode':<30}{'median s':>10}{'p95 s':>10}{'rendered':>12}")
+    for mode, runs in results.items():
+        timings = sorted(seconds for seconds, _ in runs)
+        p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+        rendered = sum(succeeded for _, succeeded in runs)
+        print(f"{mode:<30}{statistics.median(timings):>10.1f}{p95:>10.1f}{f'{rendered}/{len(runs)}':>12}")
+
+
+if __name__ == "__main__":
+    main()
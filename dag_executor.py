@@ -0,0 +1,75 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Runs a set of dependent stages on a thread pool.
+# A stage starts as soon as every stage it depends on has finished, so independent stages run
+# concurrently, and results are yielded in completion order so callers can show each one as
+# soon as it is ready.
+
+
+class DependencyFailed(Exception):
+    """A stage was not run because a stage it depends on failed or was skipped."""
+
+    def __init__(self, stage, dependency):
+        super().__init__(f"'{stage}' was skipped because '{dependency}' failed.")
+        self.stage = stage
+        self.dependency = dependency
+
+
+def validate_stages(stages, inputs=()):
+    """Raise ValueError if a stage depends on an unknown name or the dependencies form a cycle."""
+    known = set(stages) | set(inputs)
+    for name, (dependencies, _) in stages.items():
+        unknown = set(dependencies) - known
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {', '.join(sorted(unknown))}")
+    remaining = {name: set(dependencies) - set(inputs) for name, (dependencies, _) in stages.items()}
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages: {', '.join(sorted(remaining))}")
+        for name in ready:
+            del remaining[name]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+
+
+def run_dag(stages, inputs=None, max_workers=4):
+    """
+    Run `stages`, a dict of name -> (dependencies, function), and yield (name, result, error)
+    as each stage finishes.
+
+    A function is called on a worker thread with a dict holding `inputs` and the results of
+    the stages finished so far, so it must not call Streamlit. If it raises, `error` is the
+    exception and every stage depending on it, directly or not, is yielded with a
+    DependencyFailed error instead of being run.
+    """
+    inputs = dict(inputs or {})
+    validate_stages(stages, inputs)
+    results = dict(inputs)
+    pending = {name: set(dependencies) - set(inputs) for name, (dependencies, _) in stages.items()}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in [name for name, dependencies in pending.items() if not dependencies]:
+                del pending[name]
+                running[executor.submit(stages[name][1], dict(results))] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    results[name] = future.result()
+                    for dependencies in pending.values():
+                        dependencies.discard(name)
+                    yield name, results[name], None
+                    continue
+
+                yield name, None, error
+                failed = [name]
+                while failed:
+                    dependency = failed.pop()
+                    for dependent in [dependent for dependent in pending if dependency in stages[dependent][0]]:
+                        del pending[dependent]
+                        failed.append(dependent)
+                        yield dependent, None, DependencyFailed(dependent, dependency)
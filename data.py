@@ -147,6 +147,124 @@ diagrams = [
     }
     ]
 
+# Diagrams indexed by type, in catalog order
+diagrams_by_type = {diagram["diagram_type"]: diagram for diagram in diagrams}
+
+# Small, known-good example diagrams used as few-shot examples in the code generation prompt.
+# The prompt builder retrieves the ones whose title best matches the instruction.
+example_library = [
+    {
+      "diagram_type": "Sequence Diagram",
+      "title": "User login with authentication service and database",
+      "code": "@startuml\nactor User\nparticipant \"Web App\" as App\nparticipant \"Auth Service\" as Auth\ndatabase \"User DB\" as DB\nUser -> App : Enter credentials\nApp -> Auth : Validate credentials\nAuth -> DB : Find user\nDB --> Auth : User record\nalt valid password\n    Auth --> App : Token\n    App --> User : Show dashboard\nelse invalid password\n    Auth --> App : Error\n    App --> User : Show error\nend\n@enduml"
+    },
+    {
+      "diagram_type": "Sequence Diagram",
+      "title": "Online order checkout with payment gateway and asynchronous email notification",
+      "code": "@startuml\nactor Customer\nparticipant Shop\nparticipant \"Payment Gateway\" as PG\nqueue \"Mail Queue\" as MQ\nCustomer -> Shop : Checkout cart\nactivate Shop\nShop -> PG : Charge card\nPG --> Shop : Payment confirmed\nShop ->> MQ : Order confirmation email\nShop --> Customer : Order number\ndeactivate Shop\n@enduml"
+    },
+    {
+      "diagram_type": "Activity Diagram (Flow Chart) - New Syntax",
+      "title": "Approval workflow with decision, loop and parallel tasks",
+      "code": "@startuml\nstart\n:Submit request;\nwhile (Missing information?) is (yes)\n  :Ask requester for details;\nendwhile (no)\nif (Amount > 1000?) then (yes)\n  :Manager approval;\nelse (no)\n  :Automatic approval;\nendif\nfork\n  :Notify requester;\nfork again\n  :Update ledger;\nend fork\nstop\n@enduml"
+    },
+    {
+      "diagram_type": "Activity Diagram (Flow Chart) - New Syntax",
+      "title": "Customer support ticket process with swimlanes for customer, agent and engineering",
+      "code": "@startuml\n|Customer|\nstart\n:Open ticket;\n|Agent|\n:Triage ticket;\nif (Known issue?) then (yes)\n  :Send solution;\nelse (no)\n  |Engineering|\n  :Investigate bug;\n  :Release fix;\n  |Agent|\n  :Inform customer;\nendif\n|Customer|\n:Close ticket;\nstop\n@enduml"
+    },
+    {
+      "diagram_type": "Class Diagram",
+      "title": "Library domain model with inheritance, composition and multiplicity",
+      "code": "@startuml\nabstract class Item {\n  +title : String\n  +isAvailable() : bool\n}\nclass Book {\n  +isbn : String\n}\nclass DVD {\n  +duration : int\n}\nclass Member {\n  +name : String\n  +borrow(item : Item)\n}\nclass Loan {\n  +dueDate : Date\n}\nItem <|-- Book\nItem <|-- DVD\nMember \"1\" *-- \"0..*\" Loan\nLoan \"*\" --> \"1\" Item\n@enduml"
+    },
+    {
+      "diagram_type": "Class Diagram",
+      "title": "Service layer with interface, implementation, repository and dependency",
+      "code": "@startuml\ninterface OrderService {\n  +placeOrder(cart : Cart) : Order\n}\nclass OrderServiceImpl\nclass OrderRepository {\n  +save(order : Order)\n}\nenum OrderStatus {\n  NEW\n  PAID\n  SHIPPED\n}\nclass Order {\n  +status : OrderStatus\n}\nOrderService <|.. OrderServiceImpl\nOrderServiceImpl --> OrderRepository\nOrderRepository ..> Order\nOrder --> OrderStatus\n@enduml"
+    },
+    {
+      "diagram_type": "Use Case Diagram",
+      "title": "Online banking system with customer, admin, include and extend",
+      "code": "@startuml\nleft to right direction\nactor Customer\nactor Admin\nrectangle \"Online Banking\" {\n  usecase \"Log in\" as UC1\n  usecase \"Transfer money\" as UC2\n  usecase \"Verify OTP\" as UC3\n  usecase \"Manage accounts\" as UC4\n}\nCustomer --> UC1\nCustomer --> UC2\nUC2 ..> UC3 : <<include>>\nAdmin --> UC4\n@enduml"
+    },
+    {
+      "diagram_type": "Entity Relationship Diagram",
+      "title": "Database schema for customers, orders and products with keys",
+      "code": "@startuml\nentity Customer {\n  *customer_id : int <<PK>>\n  --\n  name : varchar\n  email : varchar\n}\nentity Order {\n  *order_id : int <<PK>>\n  --\n  customer_id : int <<FK>>\n  created_at : datetime\n}\nentity Product {\n  *product_id : int <<PK>>\n  --\n  price : decimal\n}\nCustomer ||--o{ Order\nOrder }o--|{ Product\n@enduml"
+    },
+    {
+      "diagram_type": "Component Diagram",
+      "title": "Microservice architecture with API gateway, services, message broker and databases",
+      "code": "@startuml\npackage \"Backend\" {\n  [API Gateway] as GW\n  [Order Service] as OS\n  [Inventory Service] as IS\n  queue \"Message Broker\" as MB\n}\ndatabase \"Orders DB\" as ODB\ndatabase \"Inventory DB\" as IDB\n[Web Client] --> GW : HTTPS\nGW --> OS : REST\nGW --> IS : REST\nOS --> MB : OrderCreated\nMB --> IS\nOS --> ODB\nIS --> IDB\n@enduml"
+    },
+    {
+      "diagram_type": "State Diagram",
+      "title": "Order lifecycle states with transitions and composite state",
+      "code": "@startuml\n[*] --> New\nNew --> Paid : payment received\nNew --> Cancelled : customer cancels\nstate Fulfilment {\n  [*] --> Picking\n  Picking --> Packed\n  Packed --> Shipped\n}\nPaid --> Fulfilment\nFulfilment --> Delivered : carrier confirms\nDelivered --> [*]\nCancelled --> [*]\n@enduml"
+    },
+    {
+      "diagram_type": "Deployment Diagram",
+      "title": "Cloud deployment with load balancer, application nodes and database cluster",
+      "code": "@startuml\nnode \"Load Balancer\" as LB\nnode \"App Server 1\" as A1 {\n  artifact \"app.war\"\n}\nnode \"App Server 2\" as A2 {\n  artifact \"app.war \"\n}\ndatabase \"PostgreSQL Cluster\" as DB\ncloud Internet\nInternet --> LB\nLB --> A1\nLB --> A2\nA1 --> DB\nA2 --> DB\n@enduml"
+    },
+    {
+      "diagram_type": "Object Diagram",
+      "title": "Snapshot of customer, order and order line objects",
+      "code": "@startuml\nobject \"alice : Customer\" as alice {\n  name = \"Alice\"\n}\nobject \"order42 : Order\" as order42 {\n  total = 59.90\n}\nobject \"line1 : OrderLine\" as line1 {\n  quantity = 2\n}\nalice --> order42\norder42 --> line1\n@enduml"
+    },
+    {
+      "diagram_type": "Timing Diagram",
+      "title": "Web request timing with browser and server states",
+      "code": "@startuml\nrobust \"Browser\" as B\nconcise \"Server\" as S\n@0\nB is Idle\nS is Idle\n@100\nB is Waiting\nS is Processing\n@300\nS is Idle\nB is Rendering\n@400\nB is Idle\n@enduml"
+    },
+    {
+      "diagram_type": "Interaction Overview Diagram",
+      "title": "Checkout overview combining decisions and referenced interactions",
+      "code": "@startuml\nstart\n:ref: Browse catalog;\nif (Cart empty?) then (yes)\n  stop\nendif\n:ref: Checkout;\n:ref: Payment;\nstop\n@enduml"
+    },
+    {
+      "diagram_type": "Gantt Chart",
+      "title": "Project plan with tasks, durations, dependencies and milestone",
+      "code": "@startgantt\nProject starts 2024-01-08\n[Requirements] requires 10 days\n[Design] requires 10 days\n[Design] starts at [Requirements]'s end\n[Implementation] requires 20 days\n[Implementation] starts at [Design]'s end\n[Release] happens at [Implementation]'s end\n@endgantt"
+    },
+    {
+      "diagram_type": "MindMap Diagram",
+      "title": "Brainstorm of product launch topics with left and right branches",
+      "code": "@startmindmap\n* Product launch\n** Marketing\n*** Social media\n*** Press release\n** Engineering\n*** Feature freeze\n*** Load testing\n-- Sales\n--- Training\n--- Pricing\n@endmindmap"
+    },
+    {
+      "diagram_type": "Work Breakdown Structure (WBS) Diagram",
+      "title": "Website project breakdown into phases and deliverables",
+      "code": "@startwbs\n* Website project\n** Discovery\n*** Stakeholder interviews\n*** Requirements document\n** Build\n*** Frontend\n*** Backend\n** Launch\n*** Go-live checklist\n@endwbs"
+    },
+    {
+      "diagram_type": "Network diagram (nwdiag)",
+      "title": "Office network with DMZ and internal networks",
+      "code": "@startnwdiag\nnwdiag {\n  network dmz {\n    address = \"210.x.x.x/24\"\n    web01 [address = \"210.x.x.1\"];\n  }\n  network internal {\n    address = \"172.x.x.x/24\";\n    web01 [address = \"172.x.x.1\"];\n    db01;\n  }\n}\n@endnwdiag"
+    },
+    {
+      "diagram_type": "Salt (Wireframe)",
+      "title": "Login form wireframe with fields and buttons",
+      "code": "@startsalt\n{\n  Login    | \"user@example.com\"\n  Password | \"****      \"\n  [Cancel] | [  OK   ]\n}\n@endsalt"
+    },
+    {
+      "diagram_type": "Wireframe",
+      "title": "Settings screen wireframe with tabs, checkboxes and dropdown",
+      "code": "@startsalt\n{+\n  {/ <b>General | Privacy | Notifications }\n  [X] Enable dark mode\n  [ ] Send usage statistics\n  Language | ^English^\n  [Save]\n}\n@endsalt"
+    },
+    {
+      "diagram_type": "ArchiMate Diagram",
+      "title": "Business process served by application service and technology node",
+      "code": "@startuml\n!include <archimate/Archimate>\nBusiness_Process(claim, \"Handle claim\")\nApplication_Service(crm, \"Customer administration\")\nTechnology_Node(server, \"Application server\")\nRel_Serving(crm, claim, \"serves\")\nRel_Realization(server, crm, \"realizes\")\n@enduml"
+    },
+    {
+      "diagram_type": "EBNF diagram",
+      "title": "Grammar for arithmetic expressions",
+      "code": "@startebnf\nexpression = term, { (\"+\" | \"-\"), term };\nterm = factor, { (\"*\" | \"/\"), factor };\nfactor = number | \"(\", expression, \")\";\n@endebnf"
+    },
+]
+
 sample_plantuml = '''@startuml
 participant User
 participant "TSLivechat" as TSL
@@ -0,0 +1,127 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# In-memory cache of LLM results keyed by the user's instruction.
+# Exact repeats are found by a hash of the normalized instruction. Lightly edited
+# instructions are found with MinHash signatures over character shingles, indexed with
+# locality-sensitive hashing (LSH) bands so a lookup only compares against a handful of
+# likely matches instead of every cached entry.
+
+SHINGLE_SIZE = 5  # characters per shingle
+NUM_HASHES = 64
+BAND_SIZE = 4  # rows per LSH band; 16 bands find pairs above ~0.6 Jaccard with high probability
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+DEFAULT_MAX_ENTRIES = 1000
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_HASH_PARAMS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME)
+    for i in range(NUM_HASHES)
+]
+
+
+def normalize_instruction(text):
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def shingles(text):
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(text):
+    hashed = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), "big")
+              for shingle in shingles(text)]
+    return tuple(min((a * value + b) % _MERSENNE_PRIME for value in hashed) for a, b in _HASH_PARAMS)
+
+
+def estimated_similarity(signature, other):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(x == y for x, y in zip(signature, other)) / NUM_HASHES
+
+
+class InstructionCache:
+    """
+    Maps (kind, context, instruction) to a cached result, where `context` holds the settings
+    that change the result (diagram type, toggles). Only entries with the same kind and
+    context are considered; the least recently used entries are dropped beyond `max_entries`.
+    Lookups match the normalized instruction exactly unless `similar` is set.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # exact key -> (signature, bucket keys, value)
+        self._buckets = {}  # LSH bucket key -> set of exact keys
+
+    @staticmethod
+    def _exact_key(kind, context, instruction):
+        content = "\0".join([kind, repr(context), instruction])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _bucket_keys(kind, context, signature):
+        return [(kind, repr(context), band, signature[band:band + BAND_SIZE])
+                for band in range(0, NUM_HASHES, BAND_SIZE)]
+
+    def get(self, kind, context, instruction, similar=False):
+        """
+        Return (value, similarity) for a cached instruction, or None. With `similar`, the closest
+        instruction at or above the similarity threshold is used when there is no exact match.
+        """
+        instruction = normalize_instruction(instruction)
+        key = self._exact_key(kind, context, instruction)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][2], 1.0
+        if not similar:
+            return None
+        signature = minhash_signature(instruction)
+        with self._lock:
+            candidates = set()
+            for bucket_key in self._bucket_keys(kind, context, signature):
+                candidates |= self._buckets.get(bucket_key, set())
+            best_key, best_similarity = None, 0.0
+            for candidate in candidates:
+                similarity = estimated_similarity(signature, self._entries[candidate][0])
+                if similarity > best_similarity:
+                    best_key, best_similarity = candidate, similarity
+            if best_key is None or best_similarity < self.similarity_threshold:
+                return None
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key][2], best_similarity
+
+    def put(self, kind, context, instruction, value):
+        instruction = normalize_instruction(instruction)
+        key = self._exact_key(kind, context, instruction)
+        signature = minhash_signature(instruction)
+        bucket_keys = self._bucket_keys(kind, context, signature)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (signature, bucket_keys, value)
+            for bucket_key in bucket_keys:
+                self._buckets.setdefault(bucket_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for bucket_key in entry[1]:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[bucket_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
@@ -0,0 +1,88 @@
+import re
+
+# Deterministic parser for the GitHub-flavoured markdown tables the models write.
+# Tolerates the usual variations: text and headings around the table, several tables in one
+# answer, missing outer pipes, alignment colons, emphasis in headers, escaped pipes, pipes
+# inside inline code and rows with too few or too many cells.
+
+DELIMITER_CELL_PATTERN = re.compile(r"^:?-+:?$")
+
+
+def split_row(line, code_spans=True):
+    """Split a table row into trimmed cells, or return None if the line is not a table row."""
+    line = line.strip()
+    if "|" not in line:
+        return None
+    cells, cell, in_code, index = [], "", False, 0
+    while index < len(line):
+        char = line[index]
+        if char == "\\" and line[index + 1:index + 2] == "|":
+            cell += "|"
+            index += 2
+            continue
+        if char == "`" and code_spans:
+            in_code = not in_code
+        if char == "|" and not in_code:
+            cells.append(cell)
+            cell = ""
+        else:
+            cell += char
+        index += 1
+    if in_code:
+        # An unmatched backtick is literal text, not the start of a code span
+        return split_row(line, code_spans=False)
+    cells.append(cell)
+    if line.startswith("|"):
+        cells = cells[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        cells = cells[:-1]
+    return [cell.strip() for cell in cells]
+
+
+def is_delimiter_row(cells):
+    return bool(cells) and all(DELIMITER_CELL_PATTERN.match(cell.replace(" ", "")) for cell in cells)
+
+
+def parse_markdown_tables(text):
+    """Return every table in `text` as a list of rows of cells, the header row first."""
+    lines = text.splitlines()
+    tables = []
+    index = 0
+    while index < len(lines) - 1:
+        header = split_row(lines[index])
+        if not header or not is_delimiter_row(split_row(lines[index + 1]) or []):
+            index += 1
+            continue
+        rows = [header]
+        index += 2
+        while index < len(lines) and (cells := split_row(lines[index])) is not None:
+            rows.append((cells + [""] * len(header))[:len(header)])
+            index += 1
+        tables.append(rows)
+    return tables
+
+
+def normalize_header(cell):
+    """Lowercase letters and digits of a header cell, so "**UC ID**", "UC_ID" and "uc-id" match."""
+    return re.sub(r"[^a-z0-9]", "", cell.lower())
+
+
+def table_records(text, columns, required=()):
+    """
+    Return the rows of every table in `text` as dicts. `columns` maps normalized header names
+    to record keys; other columns are left out. Tables without all `required` keys are skipped.
+    """
+    records = []
+    for header, *rows in parse_markdown_tables(text):
+        keys = [columns.get(normalize_header(cell)) for cell in header]
+        if not set(required) <= set(keys):
+            continue
+        for row in rows:
+            if not any(row):
+                continue
+            record = {}
+            for key, cell in zip(keys, row):
+                if key:
+                    record.setdefault(key, cell)
+            records.append(record)
+    return records
@@ -0,0 +1,113 @@
+import datetime
+import os
+import zipfile
+
+from docx.document import Document as DocxDocument
+from openpyxl import Workbook
+from openpyxl.writer.excel import ExcelWriter
+from pptx.presentation import Presentation as PptxPresentation
+
+# Saving OOXML (.pptx/.docx/.xlsx) documents with media-aware zip compression.
+# python-pptx, python-docx and openpyxl deflate every part on save, including images,
+# audio, video and embedded packages that are already compressed. Re-deflating them
+# costs most of the save time on media-heavy files for little or no size gain, so
+# those parts are stored as-is and only the XML parts are deflated.
+# The .pptx and .docx saves drive the libraries' private package writers, so save_ooxml
+# falls back to the library's own save() if a library release changes them.
+
+PRECOMPRESSED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.jpe', '.png', '.gif', '.webp', '.wdp', '.jxr',
+    '.mp4', '.m4v', '.mov', '.wmv', '.mp3', '.m4a', '.wma', '.aac', '.ogg',
+    '.zip', '.docx', '.xlsx', '.xlsm', '.pptx',
+}
+DEFAULT_COMPRESSLEVEL = 6  # zlib default; 1 is fastest, 9 is smallest
+
+
+def is_precompressed(member_name):
+    return os.path.splitext(member_name)[1].lower() in PRECOMPRESSED_EXTENSIONS
+
+
+class MediaAwareZipFile(zipfile.ZipFile):
+    """ZipFile that stores already-compressed media and deflates everything else at `compresslevel`."""
+
+    def __init__(self, file, compresslevel=DEFAULT_COMPRESSLEVEL):
+        super().__init__(file, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel,
+                         allowZip64=True, strict_timestamps=False)
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        name = zinfo_or_arcname.filename if isinstance(zinfo_or_arcname, zipfile.ZipInfo) else zinfo_or_arcname
+        if compress_type is None and is_precompressed(name):
+            compress_type = zipfile.ZIP_STORED
+        super().writestr(zinfo_or_arcname, data, compress_type=compress_type, compresslevel=compresslevel)
+
+
+class _ZipPhysWriter:
+    """Physical package writer for the python-pptx/python-docx PackageWriter steps, which only call write()."""
+
+    def __init__(self, zipf):
+        self._zipf = zipf
+
+    def write(self, pack_uri, blob):
+        self._zipf.writestr(pack_uri.membername, blob)
+
+
+def save_presentation(ppt, file, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """Equivalent of `Presentation.save()` with media-aware compression."""
+    from pptx.opc.serialized import PackageWriter as PptxPackageWriter
+
+    package = ppt.part.package
+    writer = PptxPackageWriter(file, package._rels, tuple(package.iter_parts()))
+    with MediaAwareZipFile(file, compresslevel) as zipf:
+        phys_writer = _ZipPhysWriter(zipf)
+        writer._write_content_types_stream(phys_writer)
+        writer._write_pkg_rels(phys_writer)
+        writer._write_parts(phys_writer)
+
+
+def save_document(doc, file, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """Equivalent of `Document.save()` with media-aware compression."""
+    from docx.opc.pkgwriter import PackageWriter as DocxPackageWriter
+
+    package = doc.part.package
+    parts = package.parts
+    for part in parts:
+        part.before_marshal()
+    with MediaAwareZipFile(file, compresslevel) as zipf:
+        phys_writer = _ZipPhysWriter(zipf)
+        DocxPackageWriter._write_content_types_stream(phys_writer, parts)
+        DocxPackageWriter._write_pkg_rels(phys_writer, package.rels)
+        DocxPackageWriter._write_parts(phys_writer, parts)
+
+
+def save_workbook(wb, file, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """Equivalent of `Workbook.save()` with media-aware compression."""
+    if wb.read_only:
+        raise TypeError("Workbook is read-only")
+    wb.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+    ExcelWriter(wb, MediaAwareZipFile(file, compresslevel)).save()
+
+
+def save_ooxml(document, file, compresslevel=DEFAULT_COMPRESSLEVEL):
+    """
+    Save a python-pptx Presentation, python-docx Document or openpyxl Workbook to `file`, a
+    path or a seekable binary file. If the media-aware save fails on library internals, the
+    document is saved again with the library's own save().
+    """
+    if isinstance(document, PptxPresentation):
+        save = save_presentation
+    elif isinstance(document, DocxDocument):
+        save = save_document
+    elif isinstance(document, Workbook):
+        if document.read_only:
+            raise TypeError("Workbook is read-only")
+        save = save_workbook
+    else:
+        raise TypeError(f"Unsupported document type: {type(document).__name__}")
+    try:
+        save(document, file, compresslevel)
+    except (ImportError, AttributeError, TypeError) as e:
+        print(f"Media-aware save of {type(document).__name__} failed ({e!r}); using the library save instead.")
+        if hasattr(file, "seek"):
+            file.seek(0)
+            file.truncate()
+        document.save(file)
@@ -1,33 +1,42 @@
 import streamlit as st
 import subprocess
-import os
 import re
 from pathlib import Path
 from openai import AzureOpenAI
+from PIL import Image
 import tempfile
-from data import diagrams
-import glob
-import pandas as pd
-from pathlib import Path
+import threading
+import csv
+import io
+import json
+import statistics
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from data import diagrams_by_type, example_library
+from plantuml_renderer import PlantUMLError, RenderPool, RenderTimeoutError, RenderWorkerError
+from plantuml_syntax import check_block_structure, check_plantuml_syntax, split_pages, with_layout_engine
+from instruction_cache import InstructionCache
+from prompt_builder import ExampleIndex, build_messages
+from render_cache import RenderCache
 
 
 # Path to the PlantUML .jar file
 plantuml_jar_path = Path(__file__).parent.parent / 'plantuml.jar'
 
-# import the list of supported diagrams
-df_diagrams = pd.DataFrame(diagrams)
-
-# Directory for storing output diagrams
-output_dir = Path('./diagrams')
-
+# Streamlit re-executes this page on every interaction, so process-wide setup (JVM version
+# check, render pool, OpenAI client) is cached with st.cache_resource and runs once.
+@st.cache_resource(show_spinner="Checking PlantUML...")
 def check_plantuml_jar(jar_path):
     jar_path = Path(jar_path)
     if not jar_path.is_file():
         st.error(f"PlantUML JAR file not found at {jar_path}. Please ensure the file exists and the path is correct.")
         st.stop()
     try:
-        subprocess.run(['java', '-jar', str(jar_path), '-version'], check=True, capture_output=True, text=True)
+        result = subprocess.run(['java', '-jar', str(jar_path), '-version'], check=True, capture_output=True, text=True)
         print("PlantUML JAR file loaded successfully.")
+        return result.stdout.strip().splitlines()[0] if result.stdout.strip() else "unknown"
     except subprocess.CalledProcessError as e:
         st.error(f"Error running PlantUML JAR: {e}")
         st.error(f"Error output: {e.stderr}")
@@ -36,25 +45,168 @@ def check_plantuml_jar(jar_path):
         st.error(f"Unexpected error when checking PlantUML JAR: {e}")
         st.stop()
 
-check_plantuml_jar(plantuml_jar_path)
+plantuml_version = check_plantuml_jar(plantuml_jar_path)
+
+# Download formats rendered only when requested: label -> (PlantUML output format, mime type)
+EXPORT_FORMATS = {
+    "SVG (editable)": ("svg", "image/svg+xml"),
+    "PDF": ("pdf", "application/pdf"),
+    "EPS": ("eps", "application/postscript"),
+    "ASCII art (sequence diagrams)": ("txt", "text/plain"),
+}
+
+# PlantUML writes PDF through Apache FOP and Batik, which the standard plantuml.jar does not
+# bundle, so PDF is only offered when the jar contains them or PLANTUML_PDF_EXPORT is set
+# (for a setup that adds them to the class path another way)
+@st.cache_resource
+def jar_supports_pdf(jar_path):
+    try:
+        with zipfile.ZipFile(jar_path) as jar:
+            return any(name.startswith("org/apache/fop/") for name in jar.namelist())
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+if not (st.secrets.get("PLANTUML_PDF_EXPORT", False) or jar_supports_pdf(plantuml_jar_path)):
+    del EXPORT_FORMATS["PDF"]
+
+# JVM heap per worker, and the largest image side in pixels before PlantUML crops the diagram
+PLANTUML_JVM_HEAP = st.secrets.get("PLANTUML_JVM_HEAP", "1g")
+PLANTUML_LIMIT_SIZE = st.secrets.get("PLANTUML_LIMIT_SIZE", 8192)
+
+# Warm PlantUML JVMs shared by all sessions of this process
+@st.cache_resource(show_spinner="Starting the PlantUML renderer...")
+def get_render_pool(jar_path):
+    # Only the PNG preview is rendered on every diagram; export formats start a worker on first use
+    return RenderPool(jar_path, formats=("png",), workers_per_format=st.secrets.get("PLANTUML_WORKERS", 2),
+                      java_options=[f"-Xmx{PLANTUML_JVM_HEAP}", f"-DPLANTUML_LIMIT_SIZE={PLANTUML_LIMIT_SIZE}"],
+                      on_demand_formats=[output_format for output_format, _ in EXPORT_FORMATS.values()])
+
+render_pool = get_render_pool(plantuml_jar_path)
+
+# Rendered diagrams shared across reruns and users, keyed by code, format and PlantUML version
+@st.cache_resource
+def get_render_cache():
+    cache_dir = st.secrets.get("PLANTUML_CACHE_DIR", str(Path(tempfile.gettempdir()) / "plantuml_render_cache"))
+    return RenderCache(cache_dir, max_bytes=st.secrets.get("PLANTUML_CACHE_MB", 256) * 1024 * 1024)
+
+render_cache = get_render_cache()
+
+def render_diagram(plantuml_code, output_format):
+    # The size limit changes the output of large diagrams, so it is part of the cache key
+    key = RenderCache.key(plantuml_code, output_format, f"{plantuml_version} limit={PLANTUML_LIMIT_SIZE}")
+    image = render_cache.get(key)
+    if image is None:
+        image = render_pool.render(plantuml_code, output_format)
+        render_cache.put(key, image)
+    return image
+
+def render_pages(plantuml_code, output_format):
+    """
+    Render a diagram split on `newpage` as one image per page, rendering the pages in parallel.
+    PlantUML errors report the line in `plantuml_code`, not in the page.
+    """
+    pages = split_pages(plantuml_code)
+
+    def render_page(page):
+        page_code, line_numbers = page
+        try:
+            return render_diagram(page_code, output_format)
+        except PlantUMLError as e:
+            line = line_numbers[e.line - 1] if e.line and e.line <= len(line_numbers) else None
+            raise PlantUMLError(e.message, line)
+
+    if len(pages) == 1:
+        return [render_page(pages[0])]
+    with ThreadPoolExecutor(max_workers=len(pages)) as executor:
+        return list(executor.map(render_page, pages))
+
+def pages_zip(pages, extension):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
+        for number, page in enumerate(pages, start=1):
+            zipf.writestr(f"diagram-page-{number}.{extension}", page)
+    return output.getvalue()
+
+def format_syntax_errors(errors):
+    return "PlantUML syntax error: " + "; ".join(
+        message if line is None else f"line {line}: {message}" for line, message in errors
+    )
+
+# Plans and diagram code for previous instructions, shared across sessions. Repeats (up to
+# whitespace and casing) reuse the cached result; near-duplicates only when that is enabled
+# in the sidebar, since a small edit such as a different actor can change the diagram.
+@st.cache_resource
+def get_instruction_cache():
+    return InstructionCache(max_entries=st.secrets.get("DIAGRAM_CACHE_ENTRIES", 1000),
+                            similarity_threshold=st.secrets.get("DIAGRAM_CACHE_SIMILARITY", 0.9))
+
+instruction_cache = get_instruction_cache()
+
+def cached_result(kind, context, instruction):
+    """(value, similarity) from the instruction cache per the sidebar settings, or None. No Streamlit calls."""
+    if not use_instruction_cache:
+        return None
+    return instruction_cache.get(kind, context, instruction, similar=reuse_similar_requests)
+
+def request_regenerate():
+    st.session_state['regenerate'] = True
+
+def diagram_context(diagram_type):
+    # Settings that change the generated code; cached code is only reused when they all match
+    return (diagram_type, include_title, use_aws_orange_theme, use_note, use_illustration, use_pages,
+            layout_engine_for(diagram_type))
+
+# Layout engines selectable with `!pragma layout`. Graphviz dot is PlantUML's default and runs
+# as a separate process for every render; Smetana is PlantUML's pure-Java port of dot and ELK
+# is the Eclipse Layout Kernel, both laying out inside the worker JVM. Defaults per diagram
+# type come from PLANTUML_LAYOUT_ENGINES in secrets (diagram type -> "smetana" or "elk"); see
+# benchmarks/layout_engine_benchmark.py to compare them.
+LAYOUT_ENGINES = {"Graphviz dot": None, "Smetana": "smetana", "ELK": "elk"}
+DEFAULT_LAYOUT_ENGINES = dict(st.secrets.get("PLANTUML_LAYOUT_ENGINES", {}))
+
+def layout_engine_for(diagram_type):
+    if selected_layout_engine in LAYOUT_ENGINES:
+        return LAYOUT_ENGINES[selected_layout_engine]
+    return DEFAULT_LAYOUT_ENGINES.get(diagram_type)
 
 # Set up your OpenAI API key
 api_key = st.secrets["AZURE_OPENAI_API_KEY"]
 azure_endpoint = st.secrets["AZURE_OPENAI_ENDPOINT"]
 
-client = AzureOpenAI(
-    api_key=api_key,  
-    api_version="2024-02-01",
-    azure_endpoint=azure_endpoint
-)
+@st.cache_resource
+def get_openai_client(api_key, azure_endpoint):
+    return AzureOpenAI(
+        api_key=api_key,  
+        api_version="2024-02-01",
+        azure_endpoint=azure_endpoint
+    )
+
+client = get_openai_client(api_key, azure_endpoint)
 
 # Initialize session state for PlantUML code
 if 'plantuml_code' not in st.session_state:
     st.session_state['plantuml_code'] = ""
 
-# Function to convert natural language instruction to PlantUML code using OpenAI
-def nl_to_plantuml(nl_instruction, diagram_type, include_title, use_aws_orange_theme, use_note, use_illustration, error_details=None, failed_code=None):
-    example = df_diagrams[df_diagrams['diagram_type'] == diagram_type]['example'].iloc[0]
+# Few-shot examples for the code prompt: the PROMPT_EXAMPLES examples from data.example_library
+# most relevant to the instruction, as far as they fit in PROMPT_TOKEN_BUDGET estimated tokens
+PROMPT_TOKEN_BUDGET = st.secrets.get("DIAGRAM_PROMPT_TOKEN_BUDGET", 2500)
+PROMPT_EXAMPLES = 2
+
+@st.cache_resource
+def get_example_index():
+    return ExampleIndex(example_library)
+
+example_index = get_example_index()
+
+# Chat messages asking the model for PlantUML code, based on the sidebar toggles
+# With `with_plan`, the model is asked for a JSON object holding both a plan and the code.
+def plantuml_messages(nl_instruction, diagram_type, include_title, use_aws_orange_theme, use_note, use_illustration, use_pages, error_details=None, failed_code=None, with_plan=False):
+    example = diagrams_by_type[diagram_type]['example']
+    examples = example_index.search(
+        nl_instruction,
+        diagram_type=None if diagram_type == "Let AI decide best Diagram" else diagram_type,
+        limit=PROMPT_EXAMPLES
+    )
     if diagram_type == "Let AI decide best Diagram":
         diagram_type = 'most appropriate diagram'
     # Construct the instruction message based on toggles
@@ -67,7 +219,15 @@ def nl_to_plantuml(nl_instruction, diagram_type, include_title, use_aws_orange_t
         instruction_message += " Use note if needed to explain more details."
     if use_illustration:
         instruction_message += " Use group or card if needed."
-    instruction_message += f''' You MUST Output PlantUML code for a {diagram_type} only and explain nothing.
+    if use_pages:
+        instruction_message += " If the diagram has more than about 25 elements, split it into pages with the newpage keyword."
+    if with_plan:
+        instruction_message += f''' First make a brief plan of the diagram from the user's description, then write PlantUML code for a {diagram_type} that follows the plan.
+    Respond with a JSON object with two string fields: "plan" (the plan, concise and relevant) and "plantuml" (the PlantUML code only).
+    For example the code will start with: {example}.
+    '''
+    else:
+        instruction_message += f''' You MUST Output PlantUML code for a {diagram_type} only and explain nothing.
     For example the code will start with: {example}.
     '''
 
@@ -76,85 +236,106 @@ def nl_to_plantuml(nl_instruction, diagram_type, include_title, use_aws_orange_t
         # nl_instruction += " Why this PlantUML code doesn't run? Analyze the code for any syntax error and return a corrected PlantUML code."
         nl_instruction += " You must use Sequence Diagram for this request."
 
+    return build_messages(instruction_message, nl_instruction, examples, PROMPT_TOKEN_BUDGET)
+
+# Function to convert natural language instruction to PlantUML code using OpenAI.
+# Returns the `n` generated completions (candidates), or None if the request failed.
+def nl_to_plantuml(nl_instruction, diagram_type, include_title, use_aws_orange_theme, use_note, use_illustration, use_pages, error_details=None, failed_code=None, n=1):
+    messages = plantuml_messages(nl_instruction, diagram_type, include_title, use_aws_orange_theme, use_note,
+                                 use_illustration, use_pages, error_details, failed_code)
     try:
         # Use the OpenAI API to generate a response
-        print("--------------- Instruction message:\n", instruction_message)
-        print("--------------- NL Instruction:\n", nl_instruction)
+        print("--------------- Instruction message:\n", messages[0]["content"])
+        print("--------------- NL Instruction:\n", messages[1]["content"])
+
+        if n == 1:
+            return [stream_plantuml_code(messages)]
 
         openai_response = client.chat.completions.create(
             model="gpt-4o",
-            messages=[
-                {"role": "system", "content": instruction_message},
-                {"role": "user", "content": nl_instruction}
-            ],
+            messages=messages,
             temperature=0.5,
+            n=n,  # extra candidates share the prompt tokens of a single request
             stream=False,
         )
-        plantuml_code = openai_response.choices[0].message.content
-        print(f"--------------- LLM returns PlantUML code:\n {plantuml_code}")
-        return plantuml_code
+        candidates = [choice.message.content for choice in openai_response.choices]
+        for plantuml_code in candidates:
+            print(f"--------------- LLM returns PlantUML code:\n {plantuml_code}")
+        return candidates
     except Exception as e:
         st.error(f"An error occurred with the OpenAI API: {e}")
         return None
 
-# Function to generate UML diagram from PlantUML code
-def generate_uml_diagram(plantuml_code, output_dir, plantuml_jar_path):
-    retries = 2
-    error_message = None
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)  # Ensure output directory exists
-    output_puml_file = output_dir / "output.puml"
-
-    with open(output_puml_file, 'w') as file:
-        file.write(plantuml_code)
+# A complete diagram block; the tag must be followed by a non-word character so a tag
+# split across chunks ("@endu" + "ml") is not taken as the end
+COMPLETE_DIAGRAM_PATTERN = re.compile(r"@start\w+.*?@end\w+(?=\W)", re.DOTALL)
 
-    while retries >= 0:
-        try:
-            # Run PlantUML without specifying output format to generate default PNG
-            subprocess_result = subprocess.run(
-                ['java', '-jar', plantuml_jar_path, str(output_puml_file)],
-                capture_output=True, text=True
-            )
-            # Also generate SVG by running it with the -tsvg option
-            subprocess.run(
-                ['java', '-jar', plantuml_jar_path, '-tsvg', str(output_puml_file)],
-                capture_output=True, text=True
-            )
-
-            # Find the generated SVG and PNG files
-            svg_files = list(output_dir.glob('*.svg'))
-            png_files = list(output_dir.glob('*.png'))
-
-            if subprocess_result.returncode == 0 and svg_files and png_files:
-                generated_svg_file = max(svg_files, key=os.path.getctime)
-                output_svg_file = output_dir / "output.svg"
-                generated_svg_file.rename(output_svg_file)
-
-                generated_png_file = max(png_files, key=os.path.getctime)
-                output_png_file = output_dir / "output.png"
-                generated_png_file.rename(output_png_file)
-
-                return str(output_puml_file), str(output_png_file), str(output_svg_file), None
-            else:
-                error_message = "Failed to create the output diagrams or PlantUML error."
-                if subprocess_result.stderr:
-                    error_message += f"\n{subprocess_result.stderr}"
-                retries -= 1
-        except Exception as e:
-            error_message = f"An error occurred: {str(e)}"
-            retries -= 1
-
-    return None, None, None, error_message
-
-def get_svg_download_link(svg_path):
-    with open(svg_path, "rb") as file:
-        btn = st.download_button(
-            label="Download Editable File",
-            data=file,
-            file_name="diagram.svg",
-            mime="image/svg+xml",
-            use_container_width=True
-        )
+def stream_plantuml_code(messages):
+    """
+    Stream a single completion, showing the code as it arrives, and stop reading as soon as
+    the closing @end tag is generated so the explanation the model may add is never paid for.
+    """
+    code_placeholder = st.empty()
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=messages,
+        temperature=0.5,
+        stream=True,
+    )
+    plantuml_code = ""
+    try:
+        for chunk in response:
+            # Azure sends content-filter chunks without choices
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            plantuml_code += chunk.choices[0].delta.content
+            code_placeholder.code(plantuml_code)
+            if COMPLETE_DIAGRAM_PATTERN.search(plantuml_code):
+                break
+    finally:
+        # Closing the HTTP response makes the service stop generating
+        response.close()
+        code_placeholder.empty()
+    print(f"--------------- LLM returns PlantUML code:\n {plantuml_code}")
+    return plantuml_code
+
+# Function to generate UML diagram from PlantUML code.
+# Code goes to the renderer over stdin and images come back as bytes, so concurrent
+# sessions never share files.
+# Returns one PNG per page of the diagram.
+def generate_uml_diagram(plantuml_code):
+    try:
+        # Render on the warm worker pool (or serve from the render cache) instead of starting a JVM
+        png_pages = render_pages(plantuml_code, "png")
+    except PlantUMLError as e:
+        return None, f"PlantUML error: {e}"
+    except RenderTimeoutError as e:
+        return None, f"{e} The diagram may be too large to lay out at once; try splitting it into pages with `newpage`."
+    except RenderWorkerError as e:
+        # Oversized diagrams can exhaust the JVM heap (PLANTUML_JVM_HEAP) and crash the worker
+        return None, f"An error occurred: {str(e)} If the diagram is very large, try splitting it into pages with `newpage`."
+
+    return png_pages, None
+
+def get_export_download_link(plantuml_code, page_count):
+    export_label = st.selectbox("Export format", list(EXPORT_FORMATS), label_visibility="collapsed")
+    output_format, mime = EXPORT_FORMATS[export_label]
+    # The export is rendered (and cached) only when the button is clicked; multi-page
+    # diagrams are exported as a zip with one file per page
+    if page_count > 1:
+        data = lambda: pages_zip(render_pages(plantuml_code, output_format), output_format)
+        file_name, mime = f"diagram-{output_format}.zip", "application/zip"
+    else:
+        data = lambda: render_diagram(plantuml_code, output_format)
+        file_name = f"diagram.{output_format}"
+    btn = st.download_button(
+        label=f"Download {export_label.split(' ')[0]} File",
+        data=data,
+        file_name=file_name,
+        mime=mime,
+        on_click="ignore",
+        use_container_width=True
+    )
     return btn
 
 def extract_plantuml_code(full_code):
@@ -176,92 +357,460 @@ def extract_plantuml_code(full_code):
     else:
         return None  # Return None if no valid block is found
 
-# Function to create a download link for the image
-def get_image_download_link(img_path):
-    with open(img_path, "rb") as file:
-        btn = st.download_button(
-            label="Download image of the diagram",
-            data=file,
-            file_name="diagram.png",
-            mime="image/png",
-            use_container_width=True
-        )
+def show_diagram(png_pages, plantuml_code):
+    if len(png_pages) > 1:
+        # Paged viewer for diagrams split with `newpage`
+        page = st.select_slider("Page", options=range(1, len(png_pages) + 1))
+        st.image(png_pages[page - 1], caption=f'Diagram generated by Peter (page {page} of {len(png_pages)})',
+                 use_container_width=False)
+    else:
+        st.image(png_pages[0], caption='Diagram generated by Peter', use_container_width=False)
+
+    # Provide download buttons for the image and the export formats
+    col1, col2 = st.columns(2)  # Create two columns
+    with col1:
+        png_button = get_image_download_link(png_pages)
+    with col2:
+        export_button = get_export_download_link(plantuml_code, len(png_pages))
+
+# Function to create a download link for the image (a zip of pages for multi-page diagrams)
+def get_image_download_link(png_pages):
+    if len(png_pages) > 1:
+        data, file_name, mime = pages_zip(png_pages, "png"), "diagram-pages.zip", "application/zip"
+    else:
+        data, file_name, mime = png_pages[0], "diagram.png", "image/png"
+    btn = st.download_button(
+        label="Download image of the diagram",
+        data=data,
+        file_name=file_name,
+        mime=mime,
+        use_container_width=True
+    )
     return btn
 
 # Function to generate a plan using OpenAI
+PLAN_SYSTEM_PROMPT = "Generate a brief plan based on the user's description. This plan will be used to create a diagram. Keep the plan concise and relevant."
+
 def generate_plan(nl_instruction):
+    cached = cached_result("plan", (), nl_instruction)
+    if cached:
+        plan, similarity = cached
+        st.toast(f"Reused a cached plan ({similarity:.0%} match)", icon='⚡')
+        st.session_state['served_from_cache'] = True
+        return plan
     try:
         openai_response = client.chat.completions.create(
             model="gpt-4o",
             messages=[
-                {"role": "system", "content": "Generate a brief plan based on the user's description. This plan will be used to create a diagram. Keep the plan concise and relevant."},
+                {"role": "system", "content": PLAN_SYSTEM_PROMPT},
                 {"role": "user", "content": nl_instruction}
             ],
             temperature=0.5,
             stream=False,
         )
-        return openai_response.choices[0].message.content
+        plan = openai_response.choices[0].message.content
+        instruction_cache.put("plan", (), nl_instruction, plan)
+        return plan
     except Exception as e:
         st.error(f"An error occurred with the OpenAI API: {e}")
         return None
-    
-def process_and_generate_diagrams(input_text):
+
+# Single-call planning: the plan and the code come back in one JSON response, saving the
+# sequential plan request of the two-call flow
+def parse_plan_and_code(content):
+    """Return (plan, plantuml_code) from the model's JSON response, raising ValueError if it is malformed."""
+    result = json.loads(content)
+    if not isinstance(result, dict) or not result.get("plan") or not isinstance(result.get("plantuml"), str):
+        raise ValueError("the response has no plan or no PlantUML code")
+    plan = result["plan"]
+    if isinstance(plan, list):  # the model sometimes returns the steps as a list
+        plan = "\n".join(f"- {step}" for step in plan)
+    return str(plan), result["plantuml"]
+
+def plan_and_code(nl_instruction):
+    """
+    Return (plan, plantuml_code) from a single request, or (None, None) if it failed. A cached
+    plan is returned without code, so the code comes from the diagram cache or the code prompt.
+    """
+    cached = cached_result("plan", (), nl_instruction)
+    if cached:
+        plan, similarity = cached
+        st.toast(f"Reused a cached plan ({similarity:.0%} match)", icon='⚡')
+        st.session_state['served_from_cache'] = True
+        return plan, None
+    messages = plantuml_messages(nl_instruction, selected_diagram_type, include_title, use_aws_orange_theme, use_note,
+                                 use_illustration, use_pages, with_plan=True)
+    try:
+        print("--------------- Instruction message:\n", messages[0]["content"])
+        openai_response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.5,
+            response_format={"type": "json_object"},
+            stream=False,
+        )
+        content = openai_response.choices[0].message.content
+        print(f"--------------- LLM returns plan and PlantUML code:\n {content}")
+        plan, plantuml_code = parse_plan_and_code(content)
+    except ValueError as e:
+        st.error(f"The plan and code response could not be read: {e}")
+        return None, None
+    except Exception as e:
+        st.error(f"An error occurred with the OpenAI API: {e}")
+        return None, None
+    instruction_cache.put("plan", (), nl_instruction, plan)
+    return plan, plantuml_code
+
+# Process-wide end-to-end latency (click to diagram) and render success per planning mode,
+# to compare single-call planning with the two-call flow
+PLANNING_MODES = ("No planning", "Plan, then code", "Plan and code in one request")
+PLANNING_SAMPLES = 500  # latencies kept per mode for the median
+
+@st.cache_resource
+def planning_stats():
+    return {"lock": threading.Lock(),
+            "modes": {mode: {"runs": 0, "successes": 0, "seconds": deque(maxlen=PLANNING_SAMPLES)}
+                      for mode in PLANNING_MODES}}
+
+def record_planning_run(mode, seconds, succeeded):
+    stats = planning_stats()
+    with stats["lock"]:
+        mode_stats = stats["modes"][mode]
+        mode_stats["runs"] += 1
+        mode_stats["successes"] += succeeded
+        mode_stats["seconds"].append(seconds)
+        print(f"--------------- {mode}: {seconds:.1f} s, {'rendered' if succeeded else 'failed'} "
+              f"(median {statistics.median(mode_stats['seconds']):.1f} s, "
+              f"{mode_stats['successes']} of {mode_stats['runs']} rendered)")
+
+def planning_summary():
+    stats = planning_stats()
+    with stats["lock"]:
+        return [f"{mode}: median {statistics.median(mode_stats['seconds']):.1f} s, "
+                f"{mode_stats['successes']} of {mode_stats['runs']} rendered"
+                for mode, mode_stats in stats["modes"].items() if mode_stats["runs"]]
+
+# Validate and render one candidate; safe to run on worker threads (no Streamlit calls).
+# Code that can never render (missing @start/@end tags, code fences) is rejected in
+# microseconds before it reaches a render worker. The block structure check can be wrong on
+# valid code, so it only adds hints to an error that PlantUML itself reported.
+def render_candidate(plantuml_code):
+    syntax_errors = check_plantuml_syntax(plantuml_code)
+    if syntax_errors:
+        return None, format_syntax_errors(syntax_errors)
+    png_pages, error_message = generate_uml_diagram(plantuml_code)
+    if error_message:
+        block_errors = check_block_structure(plantuml_code)
+        if block_errors:
+            error_message += " Possible cause: " + "; ".join(f"line {line}: {message}" for line, message in block_errors)
+    return png_pages, error_message
+
+# Process-wide counters showing whether speculative candidates pay for themselves
+@st.cache_resource
+def speculation_stats():
+    return {"lock": threading.Lock(), "attempts": 0, "successes": 0, "saved_round_trips": 0}
+
+def record_speculation(succeeded):
+    stats = speculation_stats()
+    with stats["lock"]:
+        stats["attempts"] += 1
+        if succeeded:
+            stats["successes"] += 1
+
+def record_first_candidate(future):
+    # The serial loop would have used the first candidate; if it failed while another one
+    # succeeded, speculation saved a regenerate-and-render round trip
+    if future.cancelled() or future.exception() or future.result()[0]:
+        return
+    stats = speculation_stats()
+    with stats["lock"]:
+        stats["saved_round_trips"] += 1
+        print(f"--------------- Speculation saved {stats['saved_round_trips']} round trips "
+              f"in {stats['attempts']} attempts ({stats['successes']} successful)")
+
+def render_first_candidate(candidates):
+    """
+    Validate and render candidates in parallel and return (plantuml_code, png_pages, error_message)
+    for the first one that renders. Candidates still queued are cancelled once one succeeds; if
+    none renders, the first candidate and its error are returned.
+    """
+    if len(candidates) == 1:
+        png_pages, error_message = render_candidate(candidates[0])
+        return candidates[0], png_pages, error_message
+
+    errors = {}
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    futures = [executor.submit(render_candidate, code) for code in candidates]
+    try:
+        for future in as_completed(futures):
+            index = futures.index(future)
+            png_pages, error_message = future.result()
+            if png_pages:
+                record_speculation(True)
+                if index != 0:
+                    # Runs once the first candidate finishes, without holding up this one
+                    futures[0].add_done_callback(record_first_candidate)
+                return candidates[index], png_pages, None
+            errors[index] = error_message
+    finally:
+        # Don't wait for candidates that are still rendering; their results are not needed
+        executor.shutdown(wait=False, cancel_futures=True)
+    record_speculation(False)
+    return candidates[0], None, errors[0]
+
+def show_generated_diagram(png_pages):
+    st.toast("Successfully generated your diagram", icon='✅')
+    # Display the generated diagram
+    show_diagram(png_pages, st.session_state['plantuml_code'])
+
+    if display_code:
+        st.text("🥳 Here's your PlantUML code if you need to generate this graph else where:")
+        st.code(
+            body=st.session_state['plantuml_code'],
+            line_numbers=True
+        )
+
+# Returns whether a diagram was rendered. `first_codes` are used for the first attempt
+# instead of asking the model, e.g. the code that came with the plan in a single request.
+def process_and_generate_diagrams(input_text, first_codes=None):
+    cached = cached_result("plantuml", diagram_context(selected_diagram_type), input_text)
+    if cached:
+        plantuml_code, similarity = cached
+        png_pages, _ = render_candidate(plantuml_code)
+        if png_pages:
+            st.toast(f"Reused a cached diagram ({similarity:.0%} match)", icon='⚡')
+            st.session_state['served_from_cache'] = True
+            st.session_state['plantuml_code'] = plantuml_code
+            st.session_state['nl_instruction'] = input_text
+            show_generated_diagram(png_pages)
+            return True
+
     retry_count = 0
     error_message = None
     while retry_count < 3:
-        with st.spinner(text="🤔 Thinking on how to draw this plan..."):
-            generated_code = nl_to_plantuml(
-                input_text,
-                selected_diagram_type,
-                include_title,
-                use_aws_orange_theme,
-                use_note,
-                use_illustration,
-                error_details=error_message,
-                failed_code=st.session_state['plantuml_code'] if error_message else None
-            )
-        if generated_code:
-            valid_plantuml_code = extract_plantuml_code(generated_code)
-            if valid_plantuml_code:
-                st.session_state['plantuml_code'] = valid_plantuml_code
+        if first_codes:
+            generated_codes, first_codes = first_codes, None
+        else:
+            with st.spinner(text="🤔 Thinking on how to draw this plan..."):
+                generated_codes = nl_to_plantuml(
+                    input_text,
+                    selected_diagram_type,
+                    include_title,
+                    use_aws_orange_theme,
+                    use_note,
+                    use_illustration,
+                    use_pages,
+                    error_details=error_message,
+                    failed_code=st.session_state['plantuml_code'] if error_message else None,
+                    n=candidate_count
+                )
+        if generated_codes:
+            layout_engine = layout_engine_for(selected_diagram_type)
+            candidates = [with_layout_engine(code, layout_engine)
+                          for code in map(extract_plantuml_code, generated_codes) if code]
+            if candidates:
                 st.session_state['nl_instruction'] = input_text
-                
-                output_puml_file, output_png_file, output_svg_file, error_message = generate_uml_diagram(
-                    st.session_state['plantuml_code'], output_dir=output_dir, plantuml_jar_path=plantuml_jar_path)
-                
-                if output_png_file:
-                    st.toast("Successfully generated your diagram", icon='✅')
-                    # Display the generated diagram
-                    st.image(str(output_png_file), caption='Diagram generated by Peter', use_container_width=False)
-                    
-                    # Provide a download button for the image
-                    col1, col2 = st.columns(2)  # Create two columns
-                    with col1:
-                        png_button = get_image_download_link(str(output_png_file))
-                    with col2:
-                        svg_button = get_svg_download_link(str(output_svg_file))
-                    
-                    if display_code:
-                        st.text("🥳 Here's your PlantUML code if you need to generate this graph else where:")
-                        plantuml_code = st.code(
-                            body=st.session_state['plantuml_code'],
-                            line_numbers=True
-                        )
-                        
-                    break  # Exit loop on success
+
+                with st.spinner(text="🎨 Drawing the diagram..."):
+                    plantuml_code, png_pages, error_message = render_first_candidate(candidates)
+                st.session_state['plantuml_code'] = plantuml_code
+
+                if png_pages:
+                    instruction_cache.put("plantuml", diagram_context(selected_diagram_type), input_text, plantuml_code)
+                    show_generated_diagram(png_pages)
+                    return True
+                else:
+                    st.error(f"{error_message} Retrying...")
+                    retry_count += 1
             else:
                 st.error("No valid PlantUML code block found. Retrying...")
                 retry_count += 1
         else:
             st.error("Failed to convert to PlantUML code.")
             break  # Exit loop on conversion failure
+    return False
+
+# Batch generation: many instructions from one file, processed concurrently.
+# LLM calls from all batches in this process share BATCH_CONCURRENCY slots so parallel
+# batches stay within the deployment's rate limits; renders queue on the shared worker pool.
+BATCH_CONCURRENCY = st.secrets.get("DIAGRAM_BATCH_CONCURRENCY", 4)
+BATCH_MAX_ROWS = st.secrets.get("DIAGRAM_BATCH_MAX_ROWS", 100)
+BATCH_MAX_ATTEMPTS = 3
+BATCH_REPORT_FIELDS = ["row", "name", "diagram_type", "status", "attempts", "seconds", "error"]
+
+@st.cache_resource
+def llm_request_slots():
+    return threading.BoundedSemaphore(BATCH_CONCURRENCY)
+
+def complete(messages, json_output=False):
+    with llm_request_slots():
+        openai_response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.5,
+            stream=False,
+            **({"response_format": {"type": "json_object"}} if json_output else {}),
+        )
+    return openai_response.choices[0].message.content
+
+def read_batch_instructions(uploaded_file):
+    """
+    Read batch rows from a CSV file with an `instruction` column, or a JSON list of objects
+    (or plain strings). Optional fields: `diagram_type` (defaults to the sidebar selection)
+    and `name` (used for the file names in the zip). Raises ValueError for malformed files.
+    """
+    if uploaded_file.name.lower().endswith(".json"):
+        records = json.load(uploaded_file)
+        if isinstance(records, dict):
+            records = records.get("instructions", [])
+        if not isinstance(records, list):
+            raise ValueError("the JSON must be a list of instructions or an object with an \"instructions\" list.")
+    else:
+        records = list(csv.DictReader(io.TextIOWrapper(uploaded_file, encoding="utf-8-sig")))
+
+    rows = []
+    for number, record in enumerate(records, start=1):
+        if isinstance(record, str):
+            record = {"instruction": record}
+        if not isinstance(record, dict):
+            raise ValueError(f"item {number} is {type(record).__name__}; expected an object or a string.")
+        for field in ("instruction", "diagram_type", "name"):
+            if record.get(field) is not None and not isinstance(record[field], str):
+                raise ValueError(f"item {number}: \"{field}\" must be a string, not {type(record[field]).__name__}.")
+        instruction = (record.get("instruction") or "").strip()
+        if instruction:
+            rows.append({
+                "instruction": instruction,
+                "diagram_type": (record.get("diagram_type") or "").strip() or selected_diagram_type,
+                "name": (record.get("name") or "").strip(),
+            })
+    return rows
+
+def batch_file_stem(row_number, row):
+    slug = re.sub(r"[^a-z0-9]+", "-", (row["name"] or row["instruction"]).lower()).strip("-")[:40]
+    return f"{row_number:03d}-{slug or 'diagram'}"
+
+def generate_batch_diagram(row_number, row):
+    """Plan, generate and render one batch row. Runs on a worker thread, so it never calls Streamlit."""
+    started = time.perf_counter()
+    result = {"row": row_number, "name": batch_file_stem(row_number, row), "diagram_type": row["diagram_type"],
+              "status": "failed", "attempts": 0, "seconds": 0.0, "error": "",
+              "plantuml_code": None, "png": None, "svg": None}
+    if row["diagram_type"] not in diagrams_by_type:
+        result["error"] = f"Unknown diagram type '{row['diagram_type']}'."
+        return result
+
+    try:
+        input_text = row["instruction"]
+        planned_code = None
+        if use_planning:
+            cached = cached_result("plan", (), input_text)
+            if cached:
+                plan = cached[0]
+            elif single_call_planning:
+                result["attempts"] += 1
+                plan, planned_code = parse_plan_and_code(complete(plantuml_messages(
+                    input_text, row["diagram_type"], include_title, use_aws_orange_theme, use_note, use_illustration, use_pages,
+                    with_plan=True
+                ), json_output=True))
+            else:
+                plan = complete([
+                    {"role": "system", "content": PLAN_SYSTEM_PROMPT},
+                    {"role": "user", "content": input_text}
+                ])
+            if not cached:
+                instruction_cache.put("plan", (), input_text, plan)
+            input_text = plan
+
+        context = diagram_context(row["diagram_type"])
+        cached = cached_result("plantuml", context, input_text)
+        plantuml_code = cached[0] if cached else None
+        if plantuml_code is None and planned_code and extract_plantuml_code(planned_code):
+            plantuml_code = with_layout_engine(extract_plantuml_code(planned_code), layout_engine_for(row["diagram_type"]))
+        error_message = None
+        while result["attempts"] < BATCH_MAX_ATTEMPTS:
+            if plantuml_code is None:
+                result["attempts"] += 1
+                generated_code = complete(plantuml_messages(
+                    input_text, row["diagram_type"], include_title, use_aws_orange_theme, use_note, use_illustration, use_pages,
+                    error_details=error_message, failed_code=result["plantuml_code"] if error_message else None
+                ))
+                plantuml_code = extract_plantuml_code(generated_code or "")
+                if not plantuml_code:
+                    error_message = "No valid PlantUML code block found."
+                    continue
+                plantuml_code = with_layout_engine(plantuml_code, layout_engine_for(row["diagram_type"]))
+            result["plantuml_code"] = plantuml_code
+            png_pages, error_message = render_candidate(plantuml_code)
+            if png_pages:
+                instruction_cache.put("plantuml", context, input_text, plantuml_code)
+                result["png"] = png_pages
+                try:
+                    result["svg"] = render_pages(plantuml_code, "svg")
+                except (PlantUMLError, RenderWorkerError) as e:
+                    error_message = f"SVG export failed: {e}"
+                result["status"] = "ok"
+                break
+            plantuml_code = None
+        result["error"] = error_message or ""
+    except Exception as e:
+        result["error"] = f"An error occurred: {e}"
+    result["seconds"] = round(time.perf_counter() - started, 1)
+    return result
+
+def build_batch_zip(results):
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
+        for result in results:
+            # Multi-page diagrams get one file per page: name-p1.png, name-p2.png, ...
+            for extension, pages in (("png", result["png"]), ("svg", result["svg"])):
+                for number, page in enumerate(pages or [], start=1):
+                    page_name = f"{result['name']}-p{number}" if len(pages) > 1 else result['name']
+                    # PNG is already compressed
+                    zipf.writestr(f"{page_name}.{extension}", page,
+                                  compress_type=zipfile.ZIP_STORED if extension == "png" else None)
+            if result["plantuml_code"]:
+                zipf.writestr(f"{result['name']}.puml", result["plantuml_code"])
+        report = io.StringIO()
+        writer = csv.DictWriter(report, fieldnames=BATCH_REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+        zipf.writestr("report.csv", report.getvalue())
+    return output.getvalue()
+
+def run_batch(rows):
+    progress_bar = st.progress(0, text=f"Generating {len(rows)} diagrams...")
+    results = []
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+        futures = [executor.submit(generate_batch_diagram, row_number, row)
+                   for row_number, row in enumerate(rows, start=1)]
+        for future in as_completed(futures):
+            results.append(future.result())
+            progress_bar.progress(len(results) / len(rows), text=f"Generated {len(results)} of {len(rows)} diagrams")
+    results.sort(key=lambda result: result["row"])
+    st.session_state['batch_result'] = {
+        "zip": build_batch_zip(results),
+        "report": [{field: result[field] for field in BATCH_REPORT_FIELDS} for result in results],
+    }
+
+# Streamlit downsizes and re-encodes images wider than this on every run, so the logo is
+# resized once per process instead
+LOGO_MAX_WIDTH = 1460
+
+@st.cache_resource
+def load_logo(path):
+    image = Image.open(path)
+    image.thumbnail((LOGO_MAX_WIDTH, image.height))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
 
 # Streamlit application layout
 st.set_page_config(page_title="Diagram Generator", page_icon=":memo:", layout='wide', initial_sidebar_state='collapsed')
 col1, col2, col3 = st.columns([1,2,1])
 with col2:
     logo_path = "bavista_logo.png" 
-    st.image(logo_path, use_container_width=True) 
+    st.image(load_logo(logo_path), use_container_width=True) 
 
 st.title('Agent Peter - Diagram Generator')
 st.markdown('**How to use Peter**', help='''1. Select the type of diagram you want to create.\n2. Describe your requirements in natural language.\n3. Click **Generate diagram** to generate code.\n4. You can **Edit** the PlantUML code if needed.\n5. You can **Download** the generated diagram.''')
@@ -270,15 +819,33 @@ st.markdown('**How to use Peter**', help='''1. Select the type of diagram you wa
 with st.sidebar:
     st.header("Agent controls:")
     # Select box for choosing diagram type
-    selected_diagram_type = st.selectbox("Choose diagram type:", df_diagrams['diagram_type'].to_list(), index=0)
+    selected_diagram_type = st.selectbox("Choose diagram type:", list(diagrams_by_type), index=0)
 
     # Toggles for instruction message content
     use_planning = st.toggle("Enable Planning Mode", value=True)
+    single_call_planning = st.toggle("Plan and code in one request", value=False, disabled=not use_planning,
+                                     help="Ask for the plan and the diagram code together instead of in two requests.")
     display_code = st.toggle("Display generated diagram code", value=False)
     include_title = st.checkbox("Include a title",value=True)
     use_aws_orange_theme = st.checkbox("Use aws-orange theme", value=True)
     use_illustration = st.checkbox("Use grouping", value=True)
+    use_pages = st.checkbox("Split large diagrams into pages", value=False)
+    selected_layout_engine = st.selectbox("Layout engine", ["Default for diagram type", *LAYOUT_ENGINES])
     use_note = st.checkbox("Use notes", value=True)
+    use_instruction_cache = st.toggle("Reuse results for repeated requests", value=True,
+                                      help="Serve the plan and diagram from cache when a previous request was the same.")
+    reuse_similar_requests = st.toggle("Also reuse results for near-duplicate requests", value=False,
+                                       disabled=not use_instruction_cache,
+                                       help="Reuse the closest cached result for a lightly edited request. "
+                                            "Edits that change the meaning may still get the old diagram.")
+    # More than one candidate per attempt renders them in parallel and keeps the first that works,
+    # trading extra completion tokens for fewer serial retries
+    candidate_count = st.slider("Parallel diagram candidates", min_value=1, max_value=4, value=1)
+    if candidate_count > 1:
+        stats = speculation_stats()
+        st.caption(f"Speculation saved {stats['saved_round_trips']} round trips in {stats['attempts']} attempts.")
+    for summary in planning_summary():
+        st.caption(summary)
 
 # Text area for user to enter natural language instructions
 nl_instruction = st.text_area(
@@ -291,56 +858,52 @@ nl_instruction = st.text_area(
 # Button to convert natural language to PlantUML code
 convert_button = st.button("Generate diagram", type="primary",use_container_width=True)
 
+# "Regenerate" after a cached result runs the request again without the cache
+regenerate = st.session_state.pop('regenerate', False)
+if regenerate:
+    use_instruction_cache = False
+
 # When the button is clicked, convert the natural language to PlantUML code
-if convert_button:
+if convert_button or regenerate:
+    started = time.perf_counter()
+    st.session_state['served_from_cache'] = False
+    succeeded = False
     if use_planning:
+        planning_mode = PLANNING_MODES[2] if single_call_planning else PLANNING_MODES[1]
         # Generate plan and directly use it for conversion
         with st.spinner(text="🤔 Planning..."):
-            plan = generate_plan(nl_instruction)
+            if single_call_planning:
+                plan, planned_code = plan_and_code(nl_instruction)
+            else:
+                plan, planned_code = generate_plan(nl_instruction), None
         if plan:
             st.session_state['plan'] = plan
             st.subheader('Done thinking ✅ Here is the plan:') 
             st.write(plan)
-            process_and_generate_diagrams(plan)
+            succeeded = process_and_generate_diagrams(plan, [planned_code] if planned_code else None)
         else:
             st.error("Failed to generate a plan.")
     else:
+        planning_mode = PLANNING_MODES[0]
         # Proceed with direct conversion using the natural language instruction
-        process_and_generate_diagrams(nl_instruction)
+        succeeded = process_and_generate_diagrams(nl_instruction)
+    record_planning_run(planning_mode, time.perf_counter() - started, succeeded)
 
 else:
     # Check if there is PlantUML code in the session state before creating the text_area
     if st.session_state['plantuml_code']:
         # Generate and display the diagram
-        output_puml_file, output_png_file, output_svg_file, error_message = generate_uml_diagram(
-            st.session_state['plantuml_code'], output_dir=output_dir, plantuml_jar_path=plantuml_jar_path)
+        png_pages, error_message = generate_uml_diagram(st.session_state['plantuml_code'])
         
-        if output_png_file and output_svg_file:
+        if png_pages:
             st.toast("Successfully generated your diagram", icon='✅')
-            st.image(str(output_png_file), caption='Diagram generated by Peter', use_container_width=False)
-                        
-            # Provide a download button for the image
-            col1, col2 = st.columns(2)
-            with col1:
-                png_button = get_image_download_link(str(output_png_file))
-            with col2:
-                svg_button = get_svg_download_link(str(output_svg_file))
+            show_diagram(png_pages, st.session_state['plantuml_code'])
 
         else:
             if error_message:
                 st.error(f"Failed to generate diagram: {error_message}")
             else:
                 st.error("Failed to generate diagram due to an unknown error.")
-
-            # Display the generated diagram
-            st.image(str(output_png_file), caption='Diagram generated by Peter', use_container_width=False)
-            
-            # Provide a download button for the image
-            col1, col2 = st.columns(2)
-            with col1:
-                png_button = get_image_download_link(str(output_png_file))
-            with col2:
-                svg_button = get_svg_download_link(str(output_svg_file))
                                     
 
             if display_code:
@@ -349,3 +912,39 @@ else:
                     body=st.session_state['plantuml_code'],
                     line_numbers=True
                 )
+
+if st.session_state.get('served_from_cache') and st.session_state['plantuml_code']:
+    st.button("Regenerate without the cache", on_click=request_regenerate, use_container_width=True,
+              help="This result came from the cache. Ask the model again for a new plan and diagram.")
+
+# Batch mode: one zip of diagrams for a whole file of instructions
+st.divider()
+with st.expander("Batch generation"):
+    st.markdown("Upload a CSV with an `instruction` column (optional `diagram_type` and `name` columns) "
+                "or a JSON list of objects with the same fields. The sidebar settings apply to every row.")
+    batch_file = st.file_uploader("Instructions file", type=["csv", "json"])
+    if batch_file and st.button("Generate all diagrams"):
+        try:
+            batch_rows = read_batch_instructions(batch_file)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            st.error(f"Could not read the instructions file: {e}")
+            batch_rows = []
+        if len(batch_rows) > BATCH_MAX_ROWS:
+            st.error(f"The file has {len(batch_rows)} instructions; the limit is {BATCH_MAX_ROWS} per batch.")
+        elif batch_rows:
+            run_batch(batch_rows)
+        else:
+            st.error("No instructions found in the file.")
+
+    if 'batch_result' in st.session_state:
+        batch_report = st.session_state['batch_result']["report"]
+        succeeded = sum(result["status"] == "ok" for result in batch_report)
+        st.write(f"{succeeded} of {len(batch_report)} diagrams generated.")
+        st.dataframe(batch_report, use_container_width=True)
+        st.download_button(
+            label="Download diagrams (zip)",
+            data=st.session_state['batch_result']["zip"],
+            file_name="diagrams.zip",
+            mime="application/zip",
+            on_click="ignore",
+        )
@@ -3,14 +3,22 @@ from docx import Document
 from io import BytesIO
 from openai import AzureOpenAI
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dag_executor import run_dag
+from markdown_table import table_records
+from token_estimator import estimate_tokens
+from transcript import chunk_transcript, compact_transcript, pack
 
 # Set up your OpenAI API key
 api_key = st.secrets["AZURE_OPENAI_API_KEY"]
 azure_endpoint = st.secrets["AZURE_OPENAI_ENDPOINT"]
+# Usage data reports cached prompt tokens from API version 2024-10-01-preview on
+api_version = st.secrets.get("AZURE_OPENAI_API_VERSION", "2024-02-01")
 
 client = AzureOpenAI(
     api_key=api_key,  
-    api_version="2024-02-01",
+    api_version=api_version,
     azure_endpoint=azure_endpoint
 )
 
@@ -22,45 +30,127 @@ def read_docx(file):
         full_text.append(para.text)
     return '\n'.join(full_text)
 
-def parse_markdown_table(md_table):
-    """Generate a response from OpenAI in JSON format."""
+def markdown_table_to_json(md_table):
+    """Generate a response from OpenAI in JSON format. Raises on API or JSON errors."""
     instruction_message = "Parse the table in markdown table to Json format"
-    try:
-        openai_response = client.chat.completions.create(
-            model="gpt-4o",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": instruction_message},
-                {"role": "user", "content": md_table}
-            ],
-            temperature=0.5,
-            max_tokens=2000,
-        )
+    openai_response = client.chat.completions.create(
+        model="gpt-4o",
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": instruction_message},
+            {"role": "user", "content": md_table}
+        ],
+        temperature=0.5,
+        max_tokens=2000,
+    )
+    return json.loads(openai_response.choices[0].message.content)
+
+# Header names of the use case table columns (normalized by markdown_table.normalize_header)
+USE_CASE_COLUMNS = {
+    "ucid": "UC_ID", "usecaseid": "UC_ID", "id": "UC_ID",
+    "ucname": "UC_Name", "usecasename": "UC_Name", "usecase": "UC_Name", "name": "UC_Name",
+    "description": "Description", "ucdescription": "Description", "usecasedescription": "Description",
+}
+
+def parse_use_case_table(md_table):
+    """Parse the generated use case table locally, or return None if it has no table with use case names and descriptions."""
+    use_cases = table_records(md_table, USE_CASE_COLUMNS, required=("UC_Name", "Description"))
+    if not use_cases:
+        return None
+    for number, use_case in enumerate(use_cases, start=1):
+        if not use_case.get("UC_ID"):
+            use_case["UC_ID"] = f"UC{number:02d}"
+    return {"use_cases": use_cases}
 
-        data_dicts =  json.loads(openai_response.choices[0].message.content)
-        return data_dicts
-        
+def use_cases_from_table(md_table):
+    """Use cases as {'use_cases': [{UC_ID, UC_Name, Description}]}, asking the model only if the local parser fails."""
+    return parse_use_case_table(md_table) or markdown_table_to_json(md_table)
+
+def parse_markdown_table(md_table):
+    """Parse the use case table into JSON, showing an error and returning None if that fails."""
+    try:
+        return use_cases_from_table(md_table)
     except Exception as e:
         st.error(f"Error in generating JSON response from OpenAI: {e}")
         return None
 
+PLAN_SYSTEM_PROMPT = "Generate a high-level software requirements document based on the transcript text. The plan describes the overview of the system functions or business processes. Besure to include Ojective and Requirements for each component. Keep the plan concise and relevant to software functions."
+
+def request_plan(user_content):
+    """Generate a requirement plan from the given transcript or notes. Raises on API errors."""
+    openai_response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": PLAN_SYSTEM_PROMPT},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.5,
+        max_tokens=2500
+    )
+    return openai_response.choices[0].message.content
+
 def generate_plan(transcript_text):
     """Generate a requirement plan using client."""
     try:
-        openai_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Generate a high-level software requirements document based on the transcript text. The plan describes the overview of the system functions or business processes. Besure to include Ojective and Requirements for each component. Keep the plan concise and relevant to software functions."},
-                {"role": "user", "content": "Below is the transcript from the meeting:\n {}".format(transcript_text)}
-            ],
-            temperature=0.5,
-            max_tokens=2500
-        )
-        generated_text = openai_response.choices[0].message.content
-        return generated_text
+        return request_plan("Below is the transcript from the meeting:\n {}".format(transcript_text))
+    except Exception as e:
+        st.error(f"An error occurred with the OpenAI API: {e}")
+        return None
+
+# Map-reduce planning for long transcripts: the transcript is split into parts on speaker turns,
+# the parts are summarized concurrently, and the plan is written from the summaries in order.
+# Summaries that together are still longer than a part are summarized again in groups.
+TRANSCRIPT_CHUNK_TOKENS = st.secrets.get("TRANSCRIPT_CHUNK_TOKENS", 6000)
+SUMMARY_MAX_TOKENS = 1000
+PART_SUMMARY_PROMPT = """Summarize this part of a meeting transcript (or of notes on it) for writing a software requirements document.
+Keep every requirement, decision, constraint, actor, data object, external system and open question, with who raised it.
+Drop greetings and small talk. Use short bullet points."""
+
+def summarize_part(part, number, total):
+    """Summarize one transcript part. Raises on API errors; safe on worker threads."""
+    openai_response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": PART_SUMMARY_PROMPT},
+            {"role": "user", "content": f"Part {number} of {total}:\n{part}"}
+        ],
+        temperature=0.3,
+        max_tokens=SUMMARY_MAX_TOKENS
+    )
+    return openai_response.choices[0].message.content
+
+def summarize_parts(parts, max_workers, progress_bar, label):
+    """Summarize parts concurrently and return the summaries in part order."""
+    summaries = [None] * len(parts)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(summarize_part, part, number, len(parts)): number - 1
+                   for number, part in enumerate(parts, start=1)}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            summaries[futures[future]] = future.result()
+            progress_bar.progress(completed / len(parts), text=f"{label}: {completed} of {len(parts)} parts")
+    return summaries
+
+def generate_plan_map_reduce(transcript_text, chunk_tokens, max_workers):
+    """Generate a requirement plan, summarizing the transcript in parts first if it is longer than one part."""
+    parts = chunk_transcript(transcript_text, chunk_tokens)
+    if len(parts) <= 1:
+        return generate_plan(transcript_text)
+
+    progress_bar = st.progress(0, text=f"Summarizing {len(parts)} parts of the transcript...")
+    try:
+        summaries = summarize_parts(parts, max_workers, progress_bar, "Summarized the transcript")
+        while len(summaries) > 1:
+            groups = pack(summaries, chunk_tokens, "\n\n")
+            if len(groups) == 1 or len(groups) == len(summaries):
+                break
+            summaries = summarize_parts(groups, max_workers, progress_bar, "Combined the summaries")
+        return request_plan("Below are notes on consecutive parts of the meeting transcript, in order:\n {}".format(
+            "\n\n".join(summaries)))
     except Exception as e:
         st.error(f"An error occurred with the OpenAI API: {e}")
         return None
+    finally:
+        progress_bar.empty()
 
 def generate_table(plan, nl_instruction):
     """Generate tables based on the requirement plan."""
@@ -147,24 +237,168 @@ def generate_permission_matrix(actor_objects, use_case_table):
     permission_matrix = openai_response.choices[0].message.content
     return permission_matrix
 
+# Use case specification requests share one system message: the fixed instructions followed
+# by the workflow. Only the user message differs between requests, so the provider can serve
+# the shared prefix from its prompt cache instead of processing the workflow every time.
+USE_CASE_SPEC_PROMPT = """Generate a concise specifications table including the following rows:
+Objective, Actor(s), Trigger, Pre-condition, User-Workflow, Post-condition, Acceptance Criteria for the use case given by the user.
+You can refer to the User Workflow below for more context."""
+SPEC_MAX_TOKENS = 2000  # per use case
+# Largest completion the deployment allows: 16,384 tokens for gpt-4o 2024-08-06 and later,
+# 4,096 for gpt-4o 2024-05-13
+MAX_OUTPUT_TOKENS = st.secrets.get("AZURE_OPENAI_MAX_OUTPUT_TOKENS", 16384)
+# Batched specs come back as JSON strings, where escaped line breaks and quotes cost extra tokens
+JSON_TOKEN_OVERHEAD = 1.2
+
+def use_case_spec_messages(workflow, user_content):
+    return [
+        {"role": "system", "content": f"{USE_CASE_SPEC_PROMPT}\n\nUser Workflow:\n{workflow}"},
+        {"role": "user", "content": user_content}
+    ]
+
+def describe_use_case(use_case):
+    return f"Use Case Name: {use_case['UC_Name']}\nDescription: {use_case['Description']}"
+
 def generate_use_case_specs(use_case, workflow):
-    """Generate detailed specifications for a use case, including workflow information."""
-    try:
-        openai_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": f"""Generate a concise specifications table including the following rows:
-                 Objective, Actor(s), Trigger, Pre-condition, User-Workflow, Post-condition, Acceptance Criteria for the following use case.\n
-                 You can refer to the User Workflow for more context: {workflow}"""},
-                {"role": "user", "content": f"Use Case Name: {use_case['UC_Name']}\nDescription: {use_case['Description']}"}
-            ],
-            temperature=0.5,
-            max_tokens=2000
-        )
-        return openai_response.choices[0].message.content
-    except Exception as e:
-        st.error(f"Error generating specifications: {e}")
-        return "Error generating specifications."
+    """
+    Generate detailed specifications for a use case, including workflow information.
+    Returns (specification, usage). Raises on API errors.
+    """
+    openai_response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=use_case_spec_messages(workflow, describe_use_case(use_case)),
+        temperature=0.5,
+        max_tokens=SPEC_MAX_TOKENS
+    )
+    return openai_response.choices[0].message.content, openai_response.usage
+
+def generate_use_case_specs_batch(use_cases, workflow):
+    """
+    Generate specifications for several use cases in one request, with the same prompt prefix as
+    generate_use_case_specs. Returns (specifications in use case order, usage). Raises on API
+    errors and ValueError if the response was cut off or does not hold one specification per
+    use case.
+    """
+    use_case_list = "\n\n".join(f"{number}. {describe_use_case(use_case)}"
+                                 for number, use_case in enumerate(use_cases, start=1))
+    openai_response = client.chat.completions.create(
+        model="gpt-4o",
+        response_format={"type": "json_object"},
+        messages=use_case_spec_messages(
+            workflow,
+            f"Write the specifications table for each of the {len(use_cases)} use cases below. Respond with a JSON object "
+            f'{{"specs": [...]}} holding one markdown specifications table per use case, in the order given.\n\n{use_case_list}'
+        ),
+        temperature=0.5,
+        max_tokens=min(int(SPEC_MAX_TOKENS * len(use_cases) * JSON_TOKEN_OVERHEAD), MAX_OUTPUT_TOKENS)
+    )
+    if openai_response.choices[0].finish_reason == "length":
+        raise ValueError("the response was cut off at the output token limit")
+    specs = json.loads(openai_response.choices[0].message.content).get("specs")
+    if not isinstance(specs, list) or len(specs) != len(use_cases) or not all(isinstance(spec, str) for spec in specs):
+        raise ValueError(f"expected {len(use_cases)} specifications in the response")
+    return specs, openai_response.usage
+
+def generate_use_case_specs_chunk(use_cases, workflow):
+    """
+    Returns (results, usages) for consecutive use cases. `results` holds the specification, or the
+    exception that prevented it, per use case; `usages` the usage of every completed request.
+    Several use cases are sent in one request, and one request per use case if that fails.
+    """
+    if len(use_cases) > 1:
+        try:
+            specs, usage = generate_use_case_specs_batch(use_cases, workflow)
+            return specs, [usage]
+        except Exception as e:
+            print(f"--------------- Batch of {len(use_cases)} use case specifications failed ({e}), retrying one by one")
+    results, usages = [], []
+    for use_case in use_cases:
+        try:
+            spec, usage = generate_use_case_specs(use_case, workflow)
+        except Exception as e:
+            results.append(e)
+            continue
+        results.append(spec)
+        usages.append(usage)
+    return results, usages
+
+def cached_prompt_tokens(usage):
+    """Cached prompt tokens from the usage data, or None if the API version doesn't report them."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None)
+
+def usage_summary(requests, prompt_tokens, cached_tokens, completion_tokens):
+    summary = f"{requests} completed requests, {prompt_tokens:,} prompt tokens"
+    if cached_tokens is None:
+        summary += " (cached tokens not reported; set AZURE_OPENAI_API_VERSION to 2024-10-01-preview or later)"
+    else:
+        summary += f" ({cached_tokens:,} cached, {cached_tokens / max(prompt_tokens, 1):.0%})"
+    return summary + f", {completion_tokens:,} completion tokens"
+
+# Instructions for the three object tables generated with generate_table
+TABLE_INSTRUCTIONS = {
+    "data_objects": "List all data objects within the software system...",
+    "actor_objects": "List all actors that directly interact with the software...",
+    "external_systems": "List all external systems or services...",
+}
+
+# Artifacts in display order, with their headings
+ARTIFACT_HEADINGS = {
+    "data_objects": "### Data Objects Table:",
+    "actor_objects": "### Actor Objects Table:",
+    "external_systems": "### External Systems Table:",
+    "workflow": "### Generated User Workflow:",
+    "state_transitions": "### Generated State Transitions:",
+    "use_case_table": "### Generated Use Case Table:",
+    "permission_matrix": "### Generated Permission Matrix:",
+}
+
+# "Generate all": every artifact with the artifacts it is generated from ("plan" is the
+# requirement plan). Stages run on worker threads as soon as their inputs are ready.
+ARTIFACT_STAGES = {
+    "data_objects": (["plan"], lambda results: generate_table(results["plan"], TABLE_INSTRUCTIONS["data_objects"])),
+    "actor_objects": (["plan"], lambda results: generate_table(results["plan"], TABLE_INSTRUCTIONS["actor_objects"])),
+    "external_systems": (["plan"], lambda results: generate_table(results["plan"], TABLE_INSTRUCTIONS["external_systems"])),
+    "workflow": (["plan", "actor_objects"],
+                 lambda results: generate_workflow(results["plan"], results["actor_objects"])),
+    "state_transitions": (["plan", "data_objects"],
+                          lambda results: generate_state_transitions(results["plan"], results["data_objects"])),
+    "use_case_table": (["plan", "actor_objects"],
+                       lambda results: generate_use_case_table(results["plan"], results["actor_objects"])),
+    "use_cases": (["use_case_table"], lambda results: use_cases_from_table(results["use_case_table"])),
+    "permission_matrix": (["actor_objects", "use_case_table"],
+                          lambda results: generate_permission_matrix(results["actor_objects"], results["use_case_table"])),
+}
+REQUIREMENTS_CONCURRENCY = st.secrets.get("REQUIREMENTS_CONCURRENCY", 4)
+
+def show_artifact(slot, key, content):
+    with slot.container():
+        st.write(ARTIFACT_HEADINGS[key])
+        st.markdown(content)
+
+def generate_all_artifacts(artifact_slots):
+    """Regenerate every artifact from the plan, showing each one in its slot as soon as it is ready."""
+    for key in ARTIFACT_STAGES:
+        st.session_state.pop(key, None)
+    for slot in artifact_slots.values():
+        slot.empty()
+
+    progress_bar = st.progress(0, text=f"Generating {len(ARTIFACT_STAGES)} artifacts...")
+    finished = 0
+    for key, result, error in run_dag(ARTIFACT_STAGES, {"plan": st.session_state['plan']}, REQUIREMENTS_CONCURRENCY):
+        finished += 1
+        progress_bar.progress(finished / len(ARTIFACT_STAGES), text=f"Generated {finished} of {len(ARTIFACT_STAGES)} artifacts")
+        if error:
+            message = f"Failed to generate {key.replace('_', ' ')}: {error}"
+            if key in artifact_slots:
+                artifact_slots[key].error(message)
+            else:
+                st.error(message)
+            continue
+        st.session_state[key] = result
+        if key in artifact_slots:
+            show_artifact(artifact_slots[key], key, result)
+    progress_bar.empty()
 
 def main():
     # Streamlit interface
@@ -186,9 +420,36 @@ def main():
         st.write("### Uploaded Document:")
         st.text_area("Content", value=text, height=300)
 
+        with st.expander("Transcript processing"):
+            use_compaction = st.toggle(
+                "Compact the transcript", value=True,
+                help="Drop timestamps, filler and call logistics and merge consecutive turns by the same speaker before planning."
+            )
+            use_map_reduce = st.toggle(
+                "Summarize long transcripts in parts", value=True,
+                help="Transcripts longer than one part are summarized part by part, in parallel, and the plan is written from the summaries."
+            )
+            chunk_tokens = st.number_input("Part size (tokens)", min_value=1000, max_value=100000,
+                                           value=TRANSCRIPT_CHUNK_TOKENS, step=1000)
+            plan_concurrency = st.slider("Parts summarized at a time", min_value=1, max_value=16,
+                                         value=REQUIREMENTS_CONCURRENCY)
+
+        # The planning requests get the compacted transcript
+        planning_text = text
+        if use_compaction:
+            started = time.perf_counter()
+            planning_text = compact_transcript(text)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            original_tokens, compacted_tokens = estimate_tokens(text), estimate_tokens(planning_text)
+            st.caption(f"Compacted the transcript from about {original_tokens:,} to {compacted_tokens:,} tokens "
+                       f"({1 - compacted_tokens / max(original_tokens, 1):.0%} fewer) in {elapsed_ms:.0f} ms.")
+
         if st.button("Generate Requirement Plan", use_container_width=True, type="primary"):
             with st.spinner('🤔Thinking on how to convert minutes to requirements...'):
-                plan = generate_plan(text)
+                if use_map_reduce:
+                    plan = generate_plan_map_reduce(planning_text, chunk_tokens, plan_concurrency)
+                else:
+                    plan = generate_plan(planning_text)
                 if plan:
                     st.session_state['plan'] = plan  # Save plan to session state
                     st.markdown("### Generated Requirement Plan:")
@@ -198,19 +459,23 @@ def main():
                     st.error('Failed to generate Requirement Plan.')
 
     # Sidebar for other actions
+    generate_all = False
     with st.sidebar:
         if 'plan' in st.session_state:
             st.write("### Actions")
+            generate_all = st.button("Generate all", type="primary",
+                                     help="Generate every artifact below, running independent ones at the same time.")
+
             if st.button("Generate Data Objects Table"):
-                data_objects = generate_table(st.session_state['plan'], "List all data objects within the software system...")
+                data_objects = generate_table(st.session_state['plan'], TABLE_INSTRUCTIONS["data_objects"])
                 st.session_state['data_objects'] = data_objects
 
             if st.button("Generate Actor Objects Table"):
-                actor_objects = generate_table(st.session_state['plan'], "List all actors that directly interact with the software...")
+                actor_objects = generate_table(st.session_state['plan'], TABLE_INSTRUCTIONS["actor_objects"])
                 st.session_state['actor_objects'] = actor_objects
 
             if st.button("Generate External System Objects"):
-                external_systems = generate_table(st.session_state['plan'], "List all external systems or services...")
+                external_systems = generate_table(st.session_state['plan'], TABLE_INSTRUCTIONS["external_systems"])
                 st.session_state['external_systems'] = external_systems
 
             if 'actor_objects' in st.session_state and 'plan' in st.session_state:
@@ -235,73 +500,91 @@ def main():
                     permission_matrix = generate_permission_matrix(st.session_state['actor_objects'], st.session_state['use_case_table'])
                     st.session_state['permission_matrix'] = permission_matrix
 
-    # Main area to display results
-    if 'data_objects' in st.session_state:
-        st.write("### Data Objects Table:")
-        st.markdown(st.session_state['data_objects'])
-
-    if 'actor_objects' in st.session_state:
-        st.write("### Actor Objects Table:")
-        st.markdown(st.session_state['actor_objects'])
-
-    if 'external_systems' in st.session_state:
-        st.write("### External Systems Table:")
-        st.markdown(st.session_state['external_systems'])
-
-    if 'workflow' in st.session_state:
-        st.write("### Generated User Workflow:")
-        st.markdown(st.session_state['workflow'])
+    # Main area to display results; every artifact has a slot that "Generate all" fills as it completes
+    artifact_slots = {}
+    for key in ARTIFACT_HEADINGS:
+        artifact_slots[key] = st.empty()
+        if key in st.session_state:
+            show_artifact(artifact_slots[key], key, st.session_state[key])
 
-    if 'state_transitions' in st.session_state:
-        st.write("### Generated State Transitions:")
-        st.markdown(st.session_state['state_transitions'])
-
-    if 'use_case_table' in st.session_state:
-        st.write("### Generated Use Case Table:")
-        st.markdown(st.session_state['use_case_table'])
+    if generate_all:
+        generate_all_artifacts(artifact_slots)
 
     if 'use_cases' in st.session_state and 'workflow' in st.session_state:
+        specs_per_request = st.number_input(
+            "Use cases per request", min_value=1, max_value=5, value=1,
+            help="Generate the specifications of several use cases in one request, sharing the workflow context."
+        )
         if st.button("Generate Use Case Specs", use_container_width=True, type="primary"):
-            # Initialize an empty list to store all use case specifications
-            use_case_specs = []
-
-            # Create placeholders for real-time updates and accumulated results
+            use_cases = st.session_state['use_cases']['use_cases']
+            workflow = st.session_state['workflow']
+            use_case_specs = [None] * len(use_cases)
+            errors = {}
+            chunks = [(start, use_cases[start:start + specs_per_request])
+                      for start in range(0, len(use_cases), specs_per_request)]
+            usage_totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": None, "completion_tokens": 0}
+
+            # Progress line above the specs, which are appended below it one element per use case
             real_time_placeholder = st.empty()
-            accumulated_results_placeholder = st.empty()
-            accumulated_results = ""  # Start with an empty string to accumulate results
-
-            # Loop through each use case and generate specifications
-            for index, use_case in enumerate(st.session_state['use_cases']['use_cases']):
-                # Generate specifications for the current use case, including workflow
-                description = generate_use_case_specs(use_case, st.session_state['workflow'])
-
-                # Append the new specification to the list
-                use_case_specs.append(description)
-
-                # Display the specification being processed in real-time
-                real_time_placeholder.markdown(f"Processing use case {index + 1}/{len(st.session_state['use_cases']['use_cases'])}...")
-
-                # Update the accumulated results with the new specification
-                accumulated_results += f"**Use Case {index + 1}:**\n{description}\n\n"
-                accumulated_results_placeholder.markdown(accumulated_results)
+            results_container = st.container()
+            shown = 0  # use_cases[:shown] are on the page
+
+            def record_chunk(start, chunk, future):
+                nonlocal shown
+                try:
+                    results, usages = future.result()
+                except Exception as e:
+                    results, usages = [e] * len(chunk), []
+                for index, result in enumerate(results, start=start):
+                    if isinstance(result, Exception):
+                        errors[index] = result
+                        result = "Error generating specifications."
+                    use_case_specs[index] = result
+                for usage in usages:
+                    usage_totals["requests"] += 1
+                    usage_totals["prompt_tokens"] += usage.prompt_tokens
+                    usage_totals["completion_tokens"] += usage.completion_tokens
+                    if cached_prompt_tokens(usage) is not None:
+                        usage_totals["cached_tokens"] = (usage_totals["cached_tokens"] or 0) + cached_prompt_tokens(usage)
+                completed = sum(spec is not None for spec in use_case_specs)
+                real_time_placeholder.markdown(f"Generated {completed}/{len(use_cases)} use case specifications...")
+
+                # Keep the use case order: show the specs once every earlier one is shown
+                while shown < len(use_cases) and use_case_specs[shown] is not None:
+                    with results_container:
+                        if shown in errors:
+                            st.error(f"Error generating specifications for use case {shown + 1}: {errors[shown]}")
+                        st.markdown(f"**Use Case {shown + 1}:**\n{use_case_specs[shown]}")
+                    shown += 1
+
+            # Up to REQUIREMENTS_CONCURRENCY requests run at a time. The first one runs alone so the
+            # shared prompt prefix is in the provider's cache before the others are sent.
+            with ThreadPoolExecutor(max_workers=REQUIREMENTS_CONCURRENCY) as executor:
+                for start, chunk in chunks[:1]:
+                    record_chunk(start, chunk, executor.submit(generate_use_case_specs_chunk, chunk, workflow))
+                futures = {executor.submit(generate_use_case_specs_chunk, chunk, workflow): (start, chunk)
+                           for start, chunk in chunks[1:]}
+                for future in as_completed(futures):
+                    record_chunk(*futures[future], future)
 
             # Clear the real-time placeholder once all specs are processed
             real_time_placeholder.empty()
+            if usage_totals["requests"]:
+                st.caption(usage_summary(**usage_totals))
 
             # Update session state with all generated use case specifications
             st.session_state['use_case_specs'] = use_case_specs
 
             # Display a completion message or any additional information
-            st.success("All use case specifications have been generated successfully!")
+            if errors:
+                st.warning(f"{len(errors)} of {len(use_cases)} use case specifications could not be generated.")
+            else:
+                st.success("All use case specifications have been generated successfully!")
     # # Display the generated use case specifications
     # if 'use_case_specs' in st.session_state:
     #     st.write("### Generated Use Case Specifications:")
     #     for spec in st.session_state['use_case_specs']:
     #         st.text(spec)
 
-    if 'permission_matrix' in st.session_state:
-        st.write("### Generated Permission Matrix:")
-        st.markdown(st.session_state['permission_matrix'])
-
 if __name__ == "__main__":
     main()
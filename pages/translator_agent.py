@@ -1,12 +1,22 @@
 import streamlit as st
 from pptx import Presentation
 from docx import Document
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
 from openpyxl import load_workbook
-from io import BytesIO
+from pathlib import Path
+import heapq
 import json
+import math
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import AzureOpenAI
 import openpyxl
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from ooxml_save import save_ooxml
+from token_estimator import estimate_chat_tokens, estimate_tokens, truncate_to_tokens
 
 # Set up your OpenAI API key
 api_key = st.secrets["AZURE_OPENAI_API_KEY"]
@@ -18,6 +28,36 @@ client = AzureOpenAI(
     azure_endpoint=azure_endpoint
 )
 
+# Slides/sheets are translated in parallel batches sharing one document glossary
+TRANSLATION_MAX_CONCURRENCY = st.secrets.get("TRANSLATOR_MAX_CONCURRENCY", 4)
+GLOSSARY_CONTEXT_TOKENS = 12000  # document text sent to the one-time glossary pass
+GLOSSARY_MAX_TERMS = 40
+GLOSSARY_MAX_TOKENS = 1000
+
+# Translated outputs are spooled to temp files once they exceed the per-job memory budget
+JOB_MEMORY_BUDGET_BYTES = st.secrets.get("TRANSLATOR_MEMORY_BUDGET_MB", 64) * 1024 * 1024
+JOB_OUTPUT_TTL_SECONDS = st.secrets.get("TRANSLATOR_OUTPUT_TTL_MINUTES", 30) * 60
+JOB_SPOOL_DIR = Path(tempfile.gettempdir()) / "translator_jobs"
+# Deflate level for XML parts on save; media parts are stored without recompression
+SAVE_COMPRESSLEVEL = st.secrets.get("TRANSLATOR_ZIP_COMPRESSLEVEL", 6)
+
+# Throughput assumptions used by the pre-flight job estimator
+REQUESTS_PER_MINUTE = st.secrets.get("AZURE_OPENAI_REQUESTS_PER_MINUTE", 300)
+TOKENS_PER_MINUTE = st.secrets.get("AZURE_OPENAI_TOKENS_PER_MINUTE", 50000)
+REQUEST_LATENCY_SECONDS = 1.5  # fixed cost of a call before the first output token
+OUTPUT_TOKENS_PER_SECOND = 60
+TRANSLATION_MAX_TOKENS = 4000
+
+# Translated output is usually longer than the English source, more so for some scripts
+OUTPUT_TOKEN_RATIOS = {
+    'Japanese': 1.4,
+    'Mandarin': 1.3,
+    'Hindi': 1.6,
+    'Arabic': 1.4,
+    'Vietnamese': 1.3,
+}
+DEFAULT_OUTPUT_TOKEN_RATIO = 1.15
+
 def extract_all_text_from_ppt(file):
     ppt = Presentation(file)
     texts = {}
@@ -105,16 +145,50 @@ def apply_translated_text_to_slide(slide, translated_dict):
 
     apply_to_shapes(slide.shapes, f"{slide.slide_id}")
 
-def translate_text(text_dict, target_language):
-    max_retries = 2
-    timeout_seconds = 120
-    attempt = 0
+def format_glossary(glossary):
+    return "\n".join(f"{term} => {translation}" for term, translation in glossary.items())
 
-    # system prompt:
+def translation_system_prompt(target_language, glossary=None):
     prompt = f"""
         You are a professional language translator.\n
         Return a json with format similar to user's provided dictionary\n
         Translate the text to {target_language}."""
+    if glossary:
+        prompt += f"""\n
+        Always translate these terms as listed in the document glossary:\n{format_glossary(glossary)}"""
+    return prompt
+
+def extract_glossary(full_context, target_language):
+    """Build a compact term table for the whole document so parallel batches translate terms consistently."""
+    prompt = f"""
+        You are a professional terminologist preparing a document for translation to {target_language}.\n
+        Pick at most {GLOSSARY_MAX_TERMS} recurring domain terms, product names, acronyms and job titles from the document.\n
+        Return a json object {{"glossary": {{"<source term>": "<{target_language} translation>"}}}}.\n
+        Keep names that should not be translated unchanged."""
+    try:
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            response_format={"type": "json_object"},
+            messages=[{"role": "system", "content": prompt},
+                      {"role": "user", "content": truncate_to_tokens(full_context, GLOSSARY_CONTEXT_TOKENS)}],
+            temperature=0,
+            max_tokens=GLOSSARY_MAX_TOKENS,
+        )
+        glossary = json.loads(response.choices[0].message.content).get("glossary", {})
+        print("------------------- Document glossary:\n", glossary)
+        return {str(term): str(translation) for term, translation in glossary.items()}
+    except Exception as e:
+        # Translation still works without a glossary, just with less consistent terminology
+        print("Glossary extraction failed:", str(e))
+        return {}
+
+def translate_text(text_dict, target_language, glossary=None):
+    max_retries = 2
+    timeout_seconds = 120
+    attempt = 0
+
+    # system prompt:
+    prompt = translation_system_prompt(target_language, glossary)
     print("------------------- System Prompt:\n", prompt)
 
     # user prompt:
@@ -130,7 +204,7 @@ def translate_text(text_dict, target_language):
                 messages=[{"role": "system", "content": prompt},
                           {"role": "user", "content": converted_dict}],
                 temperature=0.5,
-                max_tokens=4000,
+                max_tokens=TRANSLATION_MAX_TOKENS,
             )
             elapsed_time = time.time() - start_time
 
@@ -156,23 +230,88 @@ def translate_text(text_dict, target_language):
 
     return text_dict
 
-def process_pptx(file, target_language, progress_bar, total_slides):
+def translate_batches(batches, target_language, glossary, on_translated):
+    """Translate text dictionaries concurrently, calling on_translated(index, translated_dict) as each completes."""
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=TRANSLATION_MAX_CONCURRENCY,
+                            initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+        futures = {executor.submit(translate_text, batch, target_language, glossary): index
+                   for index, batch in enumerate(batches)}
+        # Results are applied on the script thread, so widgets and the document are only touched here
+        for future in as_completed(futures):
+            on_translated(futures[future], future.result())
+
+def process_pptx(file, target_language, progress_bar):
     ppt = Presentation(file)
-    for i, slide in enumerate(ppt.slides):
-        slide_text_dict, _ = extract_text_from_slide(slide)
-        translated_slide_dict = translate_text(slide_text_dict, target_language)
-        apply_translated_text_to_slide(slide, translated_slide_dict)
-        # Update progress bar based on the slide index, value between 0.0 and 1.0
-        current_progress = (i + 1) / total_slides
-        progress_bar.progress(current_progress, text= f"Processing slide {i}/{total_slides}")
+    slides, batches, slide_contexts = [], [], []
+    for slide in ppt.slides:
+        slide_text_dict, slide_context = extract_text_from_slide(slide)
+        if slide_text_dict:  # slides without text don't need a translation call
+            slides.append(slide)
+            batches.append(slide_text_dict)
+            slide_contexts.append(slide_context)
+
+    glossary = {}
+    if len(batches) > 1:
+        progress_bar.progress(0, text="📖 Building the document glossary")
+        glossary = extract_glossary("\n\n".join(slide_contexts), target_language)
+
+    total_slides = len(batches)
+    completed = 0
+
+    def on_translated(index, translated_slide_dict):
+        nonlocal completed
+        apply_translated_text_to_slide(slides[index], translated_slide_dict)
+        completed += 1
+        progress_bar.progress(completed / total_slides, text=f"Processing slide {completed}/{total_slides}")
+
+    translate_batches(batches, target_language, glossary, on_translated)
     return ppt
 
 def save_pptx(ppt, original_file_name, language):
-    output = BytesIO()
-    ppt.save(output)
+    output = open_job_spool()
+    save_ooxml(ppt, output, SAVE_COMPRESSLEVEL)
     output.seek(0)
     return output, f"{language}_translated_{original_file_name}"
 
+def iter_docx_table_cells(tbls, path_prefix="table"):
+    """
+    Yields (path, w:tc element) once per physical table cell, descending into nested tables.
+
+    Walking the XML directly avoids python-docx's row.cells, which rebuilds the cell grid for
+    every row and repeats merged cells once per grid column/row they span. Vertically merged
+    continuation cells hold no content of their own and are skipped.
+    """
+    for table_index, tbl in enumerate(tbls):
+        for row_index, tr in enumerate(tbl.tr_lst):
+            for cell_index, tc in enumerate(tr.tc_lst):
+                if tc.vMerge == "continue":
+                    continue
+                path = f"{path_prefix}_{table_index},row_{row_index},cell_{cell_index}"
+                yield path, tc
+                yield from iter_docx_table_cells(tc.tbl_lst, f"{path},table")
+
+def get_docx_cell_text(tc):
+    # Only the cell's own paragraphs; nested tables are visited as cells of their own
+    return "\n".join(p.text for p in tc.p_lst)
+
+def set_docx_cell_text(tc, parent, text):
+    paragraphs = [Paragraph(p, parent) for p in tc.p_lst]
+    lines = text.split("\n")
+    if len(lines) == len(paragraphs):
+        # Keep the cell's paragraph structure (styles, alignment) when the line count survived translation
+        for paragraph, line in zip(paragraphs, lines):
+            paragraph.text = line
+    else:
+        paragraphs[0].text = text
+        for paragraph in paragraphs[1:]:
+            p = paragraph._p
+            # Word requires a paragraph after every nested table (a cell must end with one), so those are blanked
+            if p.getprevious().tag == qn("w:tbl"):
+                paragraph.text = ""
+            else:
+                tc.remove(p)
+
 def extract_text_from_docx(doc):
     texts = {}
     full_text = []
@@ -185,14 +324,11 @@ def extract_text_from_docx(doc):
             full_text.append(run_text)
     
     # Extract text from tables
-    for table_index, table in enumerate(doc.tables):
-        for row_index, row in enumerate(table.rows):
-            for cell_index, cell in enumerate(row.cells):
-                path = f"table_{table_index},row_{row_index},cell_{cell_index}"
-                cell_text = cell.text
-                if cell_text:
-                    texts[path] = [cell_text]
-                    full_text.append(cell_text)
+    for path, tc in iter_docx_table_cells([table._tbl for table in doc.tables]):
+        cell_text = get_docx_cell_text(tc)
+        if cell_text.strip():
+            texts[path] = [cell_text]
+            full_text.append(cell_text)
     
     return texts, "\n\n".join(full_text)
 
@@ -207,12 +343,9 @@ def apply_translated_text_to_docx(doc, translated_dict):
                 run.text = translated_text
 
     # Apply translated text to tables
-    for table_index, table in enumerate(doc.tables):
-        for row_index, row in enumerate(table.rows):
-            for cell_index, cell in enumerate(row.cells):
-                path = f"table_{table_index},row_{row_index},cell_{cell_index}"
-                if path in translated_dict:
-                    cell.text = translated_dict[path][0]
+    for path, tc in iter_docx_table_cells([table._tbl for table in doc.tables]):
+        if path in translated_dict:
+            set_docx_cell_text(tc, doc, translated_dict[path][0])
 
 def process_docx(file, target_language):
     doc = Document(file)
@@ -222,8 +355,8 @@ def process_docx(file, target_language):
     return doc
 
 def save_docx(doc, original_file_name, language):
-    output = BytesIO()
-    doc.save(output)
+    output = open_job_spool()
+    save_ooxml(doc, output, SAVE_COMPRESSLEVEL)
     output.seek(0)
     return output, f"{language}_translated_{original_file_name}"
 
@@ -261,30 +394,177 @@ def apply_translated_text_to_xlsx(wb, translated_dict):
 
 # Function to Extract and Translate Text from Excel
 def process_xlsx(uploaded_file, target_language, progress_bar):
-    file_stream = BytesIO(uploaded_file.getvalue())
-    wb = load_workbook(file_stream, data_only=True)
-    sheet_texts, _ = extract_text_from_xlsx(wb)
-    total_sheets = len(wb.sheetnames)
+    wb = load_workbook(uploaded_file, data_only=True)
+    sheet_texts, full_texts = extract_text_from_xlsx(wb)
+    sheet_names = [sheet_name for sheet_name, texts in sheet_texts.items() if texts]
+    total_sheets = len(sheet_names)
     sheet_counter = 0
 
-    for sheet_name, texts in sheet_texts.items():
-        if texts:
-            translated_sheet_dict = translate_text(texts, target_language)
-            if translated_sheet_dict:
-                apply_translated_text_to_xlsx(wb, {sheet_name: translated_sheet_dict})
+    glossary = {}
+    if total_sheets > 1:
+        progress_bar.progress(0, text="📖 Building the workbook glossary")
+        glossary = extract_glossary("\n\n".join(full_texts[name] for name in sheet_names), target_language)
+
+    def on_translated(index, translated_sheet_dict):
+        nonlocal sheet_counter
+        if translated_sheet_dict:
+            apply_translated_text_to_xlsx(wb, {sheet_names[index]: translated_sheet_dict})
         sheet_counter += 1
         # Update progress bar based on the number of processed sheets
         progress_bar.progress(sheet_counter / total_sheets, text=f"Processing sheet {sheet_counter}/{total_sheets}")
 
+    translate_batches([sheet_texts[name] for name in sheet_names], target_language, glossary, on_translated)
     return wb
 
 # Function to save Excel with translations
 def save_xlsx(wb, original_file_name, language):
-    output = BytesIO()
-    wb.save(output)
+    output = open_job_spool()
+    save_ooxml(wb, output, SAVE_COMPRESSLEVEL)
     output.seek(0)
     return output, f"{language}_translated_{original_file_name}"
 
+@st.cache_resource
+def job_spool_registry():
+    """Process-wide list of (created_at, spool) so expired outputs are released even for abandoned sessions."""
+    return {"lock": threading.Lock(), "spools": []}
+
+def open_job_spool():
+    """Return a buffer that stays in memory up to the job budget and rolls over to a temp file beyond it."""
+    JOB_SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    spool = tempfile.SpooledTemporaryFile(max_size=JOB_MEMORY_BUDGET_BYTES, dir=JOB_SPOOL_DIR)
+    registry = job_spool_registry()
+    with registry["lock"]:
+        registry["spools"].append((time.time(), spool))
+    return spool
+
+def expire_job_spools():
+    """Close spooled outputs older than the TTL, freeing their memory or temp file."""
+    registry = job_spool_registry()
+    now = time.time()
+    with registry["lock"]:
+        live_spools = []
+        for created_at, spool in registry["spools"]:
+            if now - created_at > JOB_OUTPUT_TTL_SECONDS:
+                spool.close()
+            elif not spool.closed:
+                live_spools.append((created_at, spool))
+        registry["spools"] = live_spools
+
+def read_spool(spool):
+    spool.seek(0)
+    return spool.read()
+
+def store_translated_output(spool, file_name, label, mime):
+    # Replace this session's previous output right away instead of waiting for its TTL
+    previous_output = st.session_state.get('translated_output')
+    if previous_output:
+        previous_output['spool'].close()
+    st.session_state['translated_output'] = {'spool': spool, 'file_name': file_name, 'label': label, 'mime': mime}
+
+def show_translated_output():
+    output = st.session_state.get('translated_output')
+    if not output:
+        return
+    if output['spool'].closed:
+        del st.session_state['translated_output']
+        st.info("The translated file has expired, please translate the document again.")
+        return
+    # The file is read from the spool only when the button is clicked, so no copy is kept per rerun
+    st.download_button(label=output['label'], data=lambda: read_spool(output['spool']), file_name=output['file_name'],
+                       mime=output['mime'], on_click="ignore", use_container_width=True)
+    st.caption(f"Translated files are kept for {JOB_OUTPUT_TTL_SECONDS // 60} minutes.")
+
+# Group the deck-wide text dictionary into one dictionary per slide, keyed like process_pptx requests
+def split_ppt_texts_by_slide(texts):
+    slides = {}
+    for path, paragraphs in texts.items():
+        slide_index = path.split(',', 1)[0]
+        slides.setdefault(slide_index, {})[path] = paragraphs
+    return list(slides.values())
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def extract_translation_batches(file_id, _file, file_type):
+    """Return the text dictionaries that will each be sent as one translation request."""
+    if file_type == 'pptx':
+        texts, _ = extract_all_text_from_ppt(_file)
+        return split_ppt_texts_by_slide(texts)
+    elif file_type == 'docx':
+        texts, _ = extract_text_from_docx(Document(_file))
+        return [texts]
+    elif file_type == 'xlsx':
+        sheet_texts, _ = extract_text_from_xlsx(load_workbook(_file, data_only=True))
+        return [texts for texts in sheet_texts.values() if texts]
+    return []
+
+def pool_seconds(durations, workers):
+    """Wall time of running `durations` in order on a pool of `workers`, each starting on the first free worker."""
+    finish_times = [0.0] * min(workers, len(durations))
+    for duration in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times, default=0.0)
+
+def estimate_translation_job(batches, target_language):
+    """Estimate segments, tokens, requests and wall time of a translation job without calling the API."""
+    system_prompt = translation_system_prompt(target_language)
+    output_ratio = OUTPUT_TOKEN_RATIOS.get(target_language, DEFAULT_OUTPUT_TOKEN_RATIO)
+    segments = input_tokens = output_tokens = truncated_requests = 0
+    glossary_seconds = 0.0
+    request_seconds = []
+
+    # Multi-batch jobs start with one glossary pass whose term table is added to every batch prompt
+    glossary_tokens = 0
+    if len(batches) > 1:
+        glossary_tokens = min(GLOSSARY_MAX_TOKENS, GLOSSARY_MAX_TERMS * 10)
+        context_tokens = sum(estimate_tokens(text) for batch in batches
+                             for paragraphs in batch.values() for text in paragraphs)
+        input_tokens += min(context_tokens, GLOSSARY_CONTEXT_TOKENS)
+        output_tokens += glossary_tokens
+        glossary_seconds = REQUEST_LATENCY_SECONDS + glossary_tokens / OUTPUT_TOKENS_PER_SECOND
+
+    for batch in batches:
+        user_content = json.dumps({str(k): v for k, v in batch.items()})
+        segments += sum(len(paragraphs) for paragraphs in batch.values())
+        input_tokens += glossary_tokens + estimate_chat_tokens([{"role": "system", "content": system_prompt},
+                                                                {"role": "user", "content": user_content}])
+        batch_output_tokens = math.ceil(estimate_tokens(user_content) * output_ratio)
+        if batch_output_tokens > TRANSLATION_MAX_TOKENS:
+            truncated_requests += 1
+            batch_output_tokens = TRANSLATION_MAX_TOKENS
+        output_tokens += batch_output_tokens
+        request_seconds.append(REQUEST_LATENCY_SECONDS + batch_output_tokens / OUTPUT_TOKENS_PER_SECOND)
+
+    requests = len(batches) + (1 if glossary_tokens else 0)
+    # Azure counts max_tokens (not the actual completion) against the tokens-per-minute quota.
+    # A full minute of quota is available up front, so only work beyond it is rate limited.
+    rate_limited_tokens = input_tokens + requests * TRANSLATION_MAX_TOKENS
+    wall_seconds = glossary_seconds + max(
+        pool_seconds(request_seconds, TRANSLATION_MAX_CONCURRENCY),
+        (requests / REQUESTS_PER_MINUTE - 1) * 60,
+        (rate_limited_tokens / TOKENS_PER_MINUTE - 1) * 60,
+    )
+    return {
+        "segments": segments,
+        "requests": requests,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "wall_seconds": wall_seconds,
+        "truncated_requests": truncated_requests,
+    }
+
+def show_job_estimate(estimate):
+    minutes, seconds = divmod(math.ceil(estimate["wall_seconds"]), 60)
+    cols = st.columns(5)
+    cols[0].metric("Text segments", f"{estimate['segments']:,}")
+    cols[1].metric("Requests", f"{estimate['requests']:,}")
+    cols[2].metric("Input tokens (est.)", f"{estimate['input_tokens']:,}")
+    cols[3].metric("Output tokens (est.)", f"{estimate['output_tokens']:,}")
+    cols[4].metric("Expected time", f"{minutes}m {seconds:02d}s")
+    st.caption(f"Estimated locally at {TRANSLATION_MAX_CONCURRENCY} concurrent request(s), "
+               f"{REQUESTS_PER_MINUTE} requests/min and {TOKENS_PER_MINUTE:,} tokens/min.")
+    if estimate["truncated_requests"]:
+        st.warning(f"{estimate['truncated_requests']} request(s) may exceed the {TRANSLATION_MAX_TOKENS} "
+                   "output token limit and come back partially translated.")
+
 # Main function
 def main():
     st.set_page_config(page_title="Document Translator", page_icon=":memo:", layout='wide', initial_sidebar_state='collapsed')
@@ -294,6 +574,8 @@ def main():
         logo_path = "bavista_logo.png" 
         st.image(logo_path, use_container_width=True) 
 
+    expire_job_spools()
+
     st.title("Agent Philip - Document Translator")
     uploaded_file = st.file_uploader("**1. Upload your Document file**", type=["pptx", "docx", "xlsx"])
 
@@ -305,32 +587,34 @@ def main():
 
     if uploaded_file and language:
         file_type = uploaded_file.name.split('.')[-1]
+        st.markdown("**3. Review the job estimate:**")
+        batches = extract_translation_batches(uploaded_file.file_id, uploaded_file, file_type)
+        show_job_estimate(estimate_translation_job(batches, language))
         if st.button(f"Translate to **{language}**", use_container_width=True, type="primary"):
             with st.spinner("🙇🏻‍♀️ Working on this task, please give it a moment..."):
                 if file_type == 'pptx':
-                    ppt = Presentation(uploaded_file)
-                    total_slides = len(ppt.slides)
                     progress_bar = st.progress(0, text="🤔 Analyzing your slides")
-                    translated_ppt = process_pptx(uploaded_file, language, progress_bar, total_slides)
+                    translated_ppt = process_pptx(uploaded_file, language, progress_bar)
                     progress_bar.progress(100, "All done ✅")
                     st.balloons()
                     translated_ppt_bytes, new_file_name = save_pptx(translated_ppt, uploaded_file.name, language)
-                    st.download_button(label="💾 Download Translated PowerPoint", data=translated_ppt_bytes, file_name=new_file_name, mime="application/vnd.openxmlformats-officedocument.presentationml.presentation", use_container_width=True)
+                    store_translated_output(translated_ppt_bytes, new_file_name, "💾 Download Translated PowerPoint", "application/vnd.openxmlformats-officedocument.presentationml.presentation")
                 elif file_type == 'docx':
-                    doc = Document(uploaded_file)
                     progress_bar = st.progress(50, text="🤔 Analyzing your documents")
                     translated_doc = process_docx(uploaded_file, language)
                     progress_bar.progress(100, "All done ✅")
                     st.balloons()
                     translated_doc_bytes, new_file_name = save_docx(translated_doc, uploaded_file.name, language)
-                    st.download_button(label="💾 Download Translated Document", data=translated_doc_bytes, file_name=new_file_name, mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document", use_container_width=True)
+                    store_translated_output(translated_doc_bytes, new_file_name, "💾 Download Translated Document", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
                 elif file_type == 'xlsx':
                     progress_bar = st.progress(0, text="🤔 Analyzing your sheets")
                     translated_wb = process_xlsx(uploaded_file, language, progress_bar)
                     progress_bar.progress(100, "All done ✅")  # Ensure the progress bar reaches 100% when done
                     st.balloons()
                     translated_xlsx_bytes, new_file_name = save_xlsx(translated_wb, uploaded_file.name, language)
-                    st.download_button(label="💾 Download Translated Excel", data=translated_xlsx_bytes, file_name=new_file_name, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+                    store_translated_output(translated_xlsx_bytes, new_file_name, "💾 Download Translated Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+    show_translated_output()
 
 if __name__ == "__main__":
     main()
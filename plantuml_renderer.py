@@ -0,0 +1,182 @@
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Long-lived PlantUML worker JVMs.
+# Each worker runs `java -jar plantuml.jar -pipe`, which keeps reading diagrams from stdin
+# and writes each rendered image to stdout followed by a delimiter line, so a render costs
+# only the layout time instead of a full JVM start.
+
+PIPE_DELIMITER = b"___PLANTUML_DIAGRAM_END___"
+HEALTH_CHECK_DIAGRAM = "@startuml\nA -> B\n@enduml"
+STARTUP_TIMEOUT_SECONDS = 60  # first render includes JVM start and class loading
+RENDER_TIMEOUT_SECONDS = 60
+# A worker idle for longer than this is probed before it is handed out, and restarted if it fails
+IDLE_CHECK_SECONDS = 300
+HEALTH_CHECK_TIMEOUT_SECONDS = 10
+
+
+class PlantUMLError(Exception):
+    """PlantUML rejected the diagram source."""
+
+    def __init__(self, message, line=None):
+        super().__init__(message if line is None else f"line {line}: {message}")
+        self.message = message
+        self.line = line
+
+
+class RenderWorkerError(Exception):
+    """A worker JVM crashed, timed out or could not be started."""
+
+
+class RenderTimeoutError(RenderWorkerError):
+    """A diagram took longer than the render timeout; the worker is stopped and restarted on next use."""
+
+
+class RenderWorker:
+    """One PlantUML JVM in pipe mode, rendering diagrams in a single output format."""
+
+    def __init__(self, jar_path, output_format="png", java_options=()):
+        self.output_format = output_format
+        self.command = [
+            'java', '-Djava.awt.headless=true', *java_options, '-jar', str(jar_path),
+            '-pipe', f'-t{output_format}', '-charset', 'UTF-8',
+            # Errors are reported on stdout ("ERROR", line, message) ahead of the error image
+            '-pipeNoStderr', '-pipedelimitor', PIPE_DELIMITER.decode(),
+        ]
+        self.process = None
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self._responses = queue.Queue()
+        self.last_used = time.monotonic()
+        threading.Thread(target=self._read_responses, args=(self.process.stdout, self._responses), daemon=True).start()
+        self.render(HEALTH_CHECK_DIAGRAM, timeout=STARTUP_TIMEOUT_SECONDS)
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def is_healthy(self):
+        """Whether the process is running and, if it has been idle for IDLE_CHECK_SECONDS, still renders a tiny diagram."""
+        if not self.is_alive():
+            return False
+        if time.monotonic() - self.last_used < IDLE_CHECK_SECONDS:
+            return True
+        try:
+            self.render(HEALTH_CHECK_DIAGRAM, timeout=HEALTH_CHECK_TIMEOUT_SECONDS)
+            return True
+        except (RenderWorkerError, PlantUMLError):
+            return False
+
+    @staticmethod
+    def _read_responses(stdout, responses):
+        # Split stdout into one response per diagram; None signals the process exited
+        buffer = b""
+        while True:
+            chunk = stdout.read1(65536)
+            if not chunk:
+                responses.put(None)
+                return
+            buffer += chunk
+            while (index := buffer.find(PIPE_DELIMITER)) != -1:
+                # Strip the line break left over from the previous delimiter line
+                responses.put(buffer[:index].lstrip(b"\r\n"))
+                buffer = buffer[index + len(PIPE_DELIMITER):]
+
+    def render(self, code, timeout=RENDER_TIMEOUT_SECONDS):
+        """Render one diagram and return the image bytes, raising PlantUMLError for invalid code."""
+        try:
+            self.process.stdin.write(code.strip().encode('utf-8') + b"\n")
+            self.process.stdin.flush()
+            response = self._responses.get(timeout=timeout)
+            self.last_used = time.monotonic()
+        except (BrokenPipeError, OSError) as e:
+            raise RenderWorkerError(f"PlantUML worker is not running: {e}")
+        except queue.Empty:
+            # The JVM may still be busy with this diagram, so it can't take the next one
+            self.stop()
+            raise RenderTimeoutError(f"PlantUML did not finish rendering within {timeout} seconds.")
+        if response is None:
+            raise RenderWorkerError(f"PlantUML worker exited with code {self.process.wait()}.")
+        if response.startswith(b"ERROR"):
+            _, line, message = (response.split(b"\n", 3) + [b"", b""])[:3]
+            line = line.strip()
+            # PlantUML reports 0-based line positions within the diagram source
+            raise PlantUMLError(message.decode('utf-8', 'replace').strip() or "Syntax error",
+                                int(line) + 1 if line.isdigit() else None)
+        return response
+
+
+class RenderPool:
+    """
+    Pool of PlantUML workers per output format, queueing requests when all are busy.
+
+    Workers for `formats` are started up front. Formats in `on_demand_formats` get a single
+    worker, started the first time that format is requested. Workers are checked when they start, when one has
+    crashed, and before a worker idle for IDLE_CHECK_SECONDS is handed out.
+    """
+
+    def __init__(self, jar_path, formats=("png", "svg"), workers_per_format=2, java_options=(), on_demand_formats=()):
+        self.jar_path = Path(jar_path)
+        self.java_options = tuple(java_options)
+        self.on_demand_formats = set(on_demand_formats)
+        self._on_demand_lock = threading.Lock()
+        worker_formats = [output_format for output_format in formats for _ in range(workers_per_format)]
+        self._idle = {output_format: queue.Queue() for output_format in worker_formats}
+        # JVMs start in parallel so the pool is ready after roughly one startup time
+        with ThreadPoolExecutor(max_workers=len(worker_formats)) as executor:
+            workers = executor.map(lambda output_format: RenderWorker(self.jar_path, output_format, self.java_options),
+                                   worker_formats)
+            for worker in workers:
+                self._idle[worker.output_format].put(worker)
+
+    def _workers(self, output_format):
+        if output_format not in self._idle:
+            if output_format not in self.on_demand_formats:
+                raise ValueError(f"Output format '{output_format}' is not served by this pool.")
+            with self._on_demand_lock:
+                if output_format not in self._idle:
+                    workers = queue.Queue()
+                    workers.put(RenderWorker(self.jar_path, output_format, self.java_options))
+                    self._idle[output_format] = workers
+        return self._idle[output_format]
+
+    def render(self, code, output_format="png", timeout=RENDER_TIMEOUT_SECONDS):
+        """Render `code` to image bytes on the next free worker, restarting it if it has crashed or stopped responding."""
+        workers = self._workers(output_format)
+        try:
+            worker = workers.get(timeout=timeout)
+        except queue.Empty:
+            raise RenderTimeoutError(f"All PlantUML workers stayed busy for {timeout} seconds.")
+        try:
+            if not worker.is_healthy():
+                worker.restart()
+            try:
+                return worker.render(code, timeout)
+            except RenderTimeoutError:
+                raise  # rendering the same diagram again would time out again
+            except RenderWorkerError:
+                worker.restart()
+                return worker.render(code, timeout)
+        finally:
+            workers.put(worker)
+
+    def close(self):
+        for workers in self._idle.values():
+            while not workers.empty():
+                workers.get().stop()
@@ -0,0 +1,288 @@
+import re
+
+# Fast structural checks for PlantUML source, run before the code is sent to the renderer.
+# check_plantuml_syntax catches the mistakes in LLM output that can never render (missing or
+# mismatched @start/@end, unknown diagram keywords, markdown fences), so those are rejected
+# without a render. check_block_structure looks for unclosed blocks and braces; it cannot
+# follow every grammar PlantUML accepts, so its findings only explain a render that failed.
+# Errors are (line number, message) tuples, 1-based.
+
+DIAGRAM_KEYWORDS = {
+    'uml', 'mindmap', 'wbs', 'gantt', 'json', 'yaml', 'ebnf', 'regex', 'salt', 'ditaa', 'dot',
+    'math', 'latex', 'creole', 'board', 'git', 'files', 'chen', 'wire', 'chronology', 'hcl',
+    'nwdiag', 'project', 'jcckit', 'def', 'flow', 'bpm', 'sprite', 'chart',
+}
+
+# Multi-line text blocks whose content must not be parsed as diagram statements
+TEXT_BLOCKS = [
+    (re.compile(r"^(floating\s+)?[hr]?note\b(?!.*:)(?!.*\")"), re.compile(r"^end\s?[hr]?note\b")),
+    (re.compile(r"^ref\s+over\b(?!.*:)"), re.compile(r"^end\s?ref\b")),
+    (re.compile(r"^legend\b"), re.compile(r"^end\s?legend\b")),
+    (re.compile(r"^title$"), re.compile(r"^end\s?title\b")),
+]
+
+# Statement blocks: opener -> closer, with their user-facing names
+SEQUENCE_GROUP_NAME = "alt/opt/loop/par/break/critical/group"
+STATEMENT_BLOCKS = [
+    (re.compile(r"^if\s*\(.*\)\s*then\b|^if\s+\".*\"\s+then\b"), re.compile(r"^end\s?if\b"), "if", "endif"),
+    (re.compile(r"^while\s*\("), re.compile(r"^end\s?while\b"), "while", "endwhile"),
+    (re.compile(r"^repeat\s*(:.*)?$"), re.compile(r"^repeat\s*while\b"), "repeat", "repeat while"),
+    (re.compile(r"^fork$"), re.compile(r"^end\s?(fork|merge)\b"), "fork", "end fork"),
+    (re.compile(r"^split$"), re.compile(r"^end\s?split\b"), "split", "end split"),
+    (re.compile(r"^switch\s*\("), re.compile(r"^end\s?switch\b"), "switch", "endswitch"),
+    (re.compile(r"^(alt|opt|loop|par|break|critical|group)\b"), re.compile(r"^end(\s+(alt|opt|loop|par|break|critical|group))?$"),
+     SEQUENCE_GROUP_NAME, "end"),
+    (re.compile(r"^box\b"), re.compile(r"^end\s?box\b"), "box", "end box"),
+]
+
+QUOTED_PATTERN = re.compile(r'"[^"]*"')
+# Crow's foot ends of entity relationship arrows (`||--o{`, `}|..|{`), which are not braces
+ER_ARROW_END_PATTERN = re.compile(r"[}|][o|](?=[-.])|(?<=[-.])[o|][{|]")
+ARROW_PATTERN = re.compile(r"-+>|<-+|\.+>|<\.+|--")
+# Arrow, message and single-line note statements; what follows their ":" is a free-text label
+LABELLED_LINE_PATTERN = re.compile(r"^(?P<statement>(?:[^:]*?(?:[-.]{2,}|[-.]+>|<[-.]+)|\s*[hr]?note\b)[^:]*):")
+# Activity diagrams, where `break` leaves a loop instead of opening a block
+ACTIVITY_LINE_PATTERN = re.compile(r"^(start|stop|repeat\b|while\s*\(|if\s*\(|:)")
+# Characters that end an activity label (":text;" and its other shapes)
+ACTIVITY_LABEL_ENDINGS = (";", "|", "<", ">", "/", "\\", "]", "}")
+
+
+def _brace_text(line):
+    """The part of a line whose braces open or close blocks, without quoted text and labels."""
+    unquoted = QUOTED_PATTERN.sub("", line)
+    if unquoted.startswith(":"):
+        return ""  # activity label, ":text;"
+    labelled = LABELLED_LINE_PATTERN.match(unquoted)
+    if labelled:
+        unquoted = labelled.group("statement")
+    return ER_ARROW_END_PATTERN.sub("", unquoted)
+
+
+def _is_arrow_line(line):
+    # "Group -> B : hi" is a message from a participant called Group, not a group block
+    return bool(ARROW_PATTERN.search(QUOTED_PATTERN.sub("", line).split(":", 1)[0]))
+
+
+def _block_for_closer(line):
+    for opener, closer, opener_name, closer_name in STATEMENT_BLOCKS:
+        if closer.match(line):
+            return opener_name, closer_name
+    return None
+
+
+def _content_lines(code):
+    return [(number, line.strip()) for number, line in enumerate(code.splitlines(), start=1) if line.strip()]
+
+
+def check_plantuml_syntax(code):
+    """Return a list of (line, message) errors that keep the diagram from rendering, empty if none are found."""
+    content = _content_lines(code)
+    if not content:
+        return [(1, "The diagram is empty.")]
+
+    errors = []
+    first_number, first_line = content[0]
+    last_number, last_line = content[-1]
+    start = re.match(r"@start(\w+)", first_line)
+    end = re.match(r"@end(\w+)", last_line)
+    if not start:
+        errors.append((first_number, "The diagram must start with an @start tag such as @startuml."))
+    elif start.group(1).lower() not in DIAGRAM_KEYWORDS:
+        errors.append((first_number, f"Unknown diagram type '@start{start.group(1)}'."))
+    if not end:
+        errors.append((last_number, "The diagram must end with an @end tag such as @enduml."))
+    elif start and start.group(1).lower() != end.group(1).lower():
+        errors.append((last_number, f"'@end{end.group(1)}' does not match '@start{start.group(1)}'."))
+    for number, line in content[1:-1]:
+        if re.match(r"@(start|end)\w+", line):
+            errors.append((number, f"Unexpected '{line.split()[0]}' inside the diagram; only one diagram is allowed."))
+        elif line.startswith("```"):
+            errors.append((number, "Markdown code fence inside the diagram."))
+    return errors
+
+
+def check_block_structure(code):
+    """
+    Return a list of (line, message) findings about unclosed or mismatched blocks and braces in
+    an @startuml diagram. Findings can be wrong for valid code, so use them to explain a failed
+    render rather than to reject code.
+    """
+    content = _content_lines(code)
+    if len(content) < 2 or not content[0][1].lower().startswith("@startuml"):
+        # Other diagram types have their own grammars
+        return []
+    body = content[1:-1] if re.match(r"@end", content[-1][1]) else content[1:]
+    is_activity = any(ACTIVITY_LINE_PATTERN.match(line.lower()) for _, line in body)
+
+    errors = []
+    stack = []  # (line number, opener name, closer name) for open blocks and braces
+    text_block_closer = None
+    in_block_comment = False
+    in_activity_label = False
+    for number, line in body:
+        lowered = line.lower()
+        if in_block_comment:
+            in_block_comment = "'/" not in line
+            continue
+        if lowered.startswith("/'"):
+            in_block_comment = "'/" not in line[2:]
+            continue
+        if lowered.startswith("'"):
+            continue
+        if in_activity_label:
+            in_activity_label = not line.endswith(ACTIVITY_LABEL_ENDINGS)
+            continue
+        if line.startswith(":"):
+            # A multi-line activity label runs until a line ending with its closing character
+            in_activity_label = not line[1:].endswith(ACTIVITY_LABEL_ENDINGS)
+            continue
+        if text_block_closer:
+            if text_block_closer.match(lowered):
+                text_block_closer = None
+                stack.pop()
+            continue
+
+        text_block = next((closer for opener, closer in TEXT_BLOCKS if opener.match(lowered)), None)
+        if text_block:
+            text_block_closer = text_block
+            stack.append((number, lowered.split()[0], "end " + lowered.split()[0].lstrip("hr")))
+            continue
+
+        arrow_line = _is_arrow_line(line)
+        closed = None if arrow_line else _block_for_closer(lowered)
+        if closed:
+            opener_name, closer_name = closed
+            if stack and stack[-1][2] == closer_name:
+                stack.pop()
+            elif closer_name == "end" and not any(entry[2] == "end" for entry in stack):
+                pass  # a bare `end` also terminates an activity flow
+            elif stack and stack[-1][2] != "}":
+                errors.append((number, f"'{line}' closes a block, but the '{stack[-1][1]}' opened on line "
+                                       f"{stack[-1][0]} needs '{stack[-1][2]}' first."))
+                return errors
+            else:
+                errors.append((number, f"'{line}' has no matching '{opener_name}'."))
+                return errors
+            continue
+
+        opened = None if arrow_line else next(
+            ((opener_name, closer_name) for opener, _, opener_name, closer_name in STATEMENT_BLOCKS
+             if opener.match(lowered)), None)
+        if opened and not (is_activity and opened[0] == SEQUENCE_GROUP_NAME and lowered.split()[0] == "break"):
+            stack.append((number, lowered.split()[0], opened[1]))
+
+        for char in _brace_text(line):
+            if char == "{":
+                stack.append((number, "{", "}"))
+            elif char == "}":
+                if stack and stack[-1][2] == "}":
+                    stack.pop()
+                elif stack:
+                    errors.append((number, f"'}}' closes a brace, but the '{stack[-1][1]}' opened on line "
+                                           f"{stack[-1][0]} needs '{stack[-1][2]}' first."))
+                    return errors
+                else:
+                    errors.append((number, "'}' has no matching '{'."))
+                    return errors
+
+    for number, opener_name, closer_name in stack:
+        errors.append((number, f"'{opener_name}' is never closed; expected '{closer_name}' before the @end tag."))
+    return errors
+
+
+# Lines that configure the whole diagram; when a diagram is split on `newpage`, those on
+# the first page are repeated on every page
+SETTING_PATTERN = re.compile(
+    r"^(!|skinparam\b|hide\b|show\b|scale\b|left to right direction|top to bottom direction|allowmixing\b|"
+    r"set\s+namespaceseparator\b|<style>)", re.IGNORECASE
+)
+# Sequence diagram declarations, repeated so participants keep their order and style. The same
+# keywords declare elements of class, ER and deployment diagrams, which are not repeated.
+DECLARATION_PATTERN = re.compile(
+    r"^(participant|actor|boundary|control|entity|database|collections|queue)\b", re.IGNORECASE
+)
+# Statements found only in sequence diagrams, and elements that never appear in them
+SEQUENCE_PATTERN = re.compile(
+    r"^(participant|boundary|control|collections|activate|deactivate|destroy|autonumber|return)\b"
+    r"|^(alt|opt|loop|par|critical)\b|^(ref|note)\s+over\b|^\.\.\.|^==", re.IGNORECASE
+)
+NON_SEQUENCE_PATTERN = re.compile(
+    r"^(class|interface|enum|abstract|annotation|usecase|package|namespace|component|node|object|state)\b"
+    r"|^(entity|database|queue|actor)\b.*\{|^:|^start$", re.IGNORECASE
+)
+NEWPAGE_PATTERN = re.compile(r"^newpage\b\s*(.*)$", re.IGNORECASE)
+
+
+def split_pages(code):
+    """
+    Split a diagram on `newpage` into standalone single-page diagrams that can be rendered
+    independently. Every page gets the settings (theme, skinparams, directives) of the first
+    page, and in a sequence diagram its participant declarations; `newpage <title>` becomes
+    the page title.
+
+    Returns a list of (page_code, line_numbers), where line_numbers[i] is the line of
+    `code` (1-based) that page line i + 1 came from, or None for repeated header lines.
+    """
+    lines = code.strip().splitlines()
+    if len(lines) < 2 or not any(NEWPAGE_PATTERN.match(line.strip()) for line in lines[1:-1]):
+        return [(code, list(range(1, len(lines) + 1)))]
+
+    # Page bodies as lists of (original line number, text), without @start/@end
+    pages = [[]]
+    titles = [None]
+    for number, line in enumerate(lines[1:-1], start=2):
+        newpage = NEWPAGE_PATTERN.match(line.strip())
+        if newpage:
+            pages.append([])
+            titles.append(newpage.group(1).strip() or None)
+        else:
+            pages[-1].append((number, line))
+
+    body = [line.strip() for page in pages for _, line in page]
+    is_sequence = (any(SEQUENCE_PATTERN.match(line) for line in body)
+                   and not any(NON_SEQUENCE_PATTERN.match(line) for line in body))
+
+    # Settings and declarations of the first page, keeping multi-line blocks ({...}, <style>) whole.
+    # Declarations with a body are elements of the page, not participants.
+    header = []
+    depth = 0
+    in_style = False
+    for number, line in pages[0]:
+        stripped = line.strip()
+        if depth or in_style or not stripped or stripped.startswith("'") or SETTING_PATTERN.match(stripped) \
+                or (is_sequence and DECLARATION_PATTERN.match(stripped) and "{" not in stripped):
+            header.append(line)
+            depth = max(depth + stripped.count("{") - stripped.count("}"), 0)
+            in_style = (in_style or stripped.lower().startswith("<style>")) and "</style>" not in stripped.lower()
+
+    result = []
+    for index, (page, title) in enumerate(zip(pages, titles)):
+        page_lines = [lines[0]]
+        line_numbers = [1]
+        if index:
+            page_lines += header
+            line_numbers += [None] * len(header)
+            if title:
+                page_lines.append(f"title {title}")
+                line_numbers.append(None)
+        page_lines += [line for _, line in page]
+        line_numbers += [number for number, _ in page]
+        page_lines.append(lines[-1])
+        line_numbers.append(len(lines))
+        result.append(("\n".join(page_lines), line_numbers))
+    return result
+
+
+LAYOUT_PRAGMA_PATTERN = re.compile(r"^\s*!pragma\s+layout\b.*\n?", re.IGNORECASE | re.MULTILINE)
+
+
+def with_layout_engine(code, engine):
+    """
+    Return `code` set to be laid out by `engine` ("smetana" or "elk") through `!pragma layout`,
+    replacing any layout pragma already in the code. With engine None the code is returned
+    unchanged, so PlantUML uses its default (Graphviz dot).
+    """
+    if not engine:
+        return code
+    start_line, _, body = code.partition("\n")
+    return f"{start_line}\n!pragma layout {engine}\n{LAYOUT_PRAGMA_PATTERN.sub('', body)}"
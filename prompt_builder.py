@@ -0,0 +1,69 @@
+import math
+import re
+from collections import Counter
+
+from token_estimator import estimate_chat_tokens, estimate_tokens, truncate_to_tokens
+
+# Few-shot example retrieval and token budgeting for the PlantUML generation prompt.
+# Examples are ranked by how many (IDF-weighted) words of the instruction appear in their
+# title and code, and only as many as fit in the prompt's token budget are included.
+
+WORD_PATTERN = re.compile(r"[a-z][a-z0-9]+")
+STOP_WORDS = {
+    'the', 'and', 'for', 'with', 'from', 'into', 'that', 'this', 'are', 'was', 'will', 'can', 'its',
+    'has', 'have', 'how', 'what', 'when', 'who', 'use', 'using', 'each', 'then', 'their', 'them',
+    'should', 'must', 'diagram', 'show', 'create', 'draw', 'explain',
+}
+
+
+def words(text):
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+class ExampleIndex:
+    """Ranks example diagrams ({"diagram_type", "title", "code"} dicts) by relevance to an instruction."""
+
+    def __init__(self, examples):
+        self.examples = list(examples)
+        # Title words count double: they describe what the example is about
+        self._terms = [Counter(words(example["title"]) * 2 + words(example["code"])) for example in self.examples]
+        document_frequency = Counter(term for terms in self._terms for term in terms)
+        self._idf = {term: math.log(1 + len(self.examples) / count) for term, count in document_frequency.items()}
+
+    def search(self, instruction, diagram_type=None, limit=2):
+        """Return up to `limit` examples, best first; with `diagram_type`, only examples of that type."""
+        query = set(words(instruction))
+        scored = []
+        for position, (example, terms) in enumerate(zip(self.examples, self._terms)):
+            if diagram_type and example["diagram_type"] != diagram_type:
+                continue
+            score = sum(self._idf[term] * (1 + math.log(terms[term])) for term in query if term in terms)
+            # Ties (including no overlap) keep the library order, which lists the canonical example first
+            scored.append((-score, position, example))
+        return [example for _, _, example in sorted(scored)[:limit]]
+
+
+def format_example(example):
+    return f"Example ({example['title']}):\n```plantuml\n{example['code']}\n```"
+
+
+def build_messages(system_prompt, user_prompt, examples, max_tokens):
+    """
+    Assemble system and user messages within `max_tokens` estimated prompt tokens.
+    Examples are appended to the system prompt in the order given while they fit; if the
+    prompt is still over budget without any example, the user prompt is truncated.
+    """
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+    over_budget = estimate_chat_tokens(messages) - max_tokens
+    if over_budget > 0:
+        messages[1]["content"] = truncate_to_tokens(user_prompt, estimate_tokens(user_prompt) - over_budget)
+        return messages
+
+    remaining = -over_budget
+    for example in examples:
+        text = "\n\n" + format_example(example)
+        cost = estimate_tokens(text)
+        if cost <= remaining:
+            messages[0]["content"] += text
+            remaining -= cost
+    return messages
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+# Content-addressed on-disk cache for rendered diagrams.
+# Entries are keyed by a hash of the diagram source, output format and renderer version,
+# so identical diagrams are served from disk across reruns, sessions and processes.
+# Reads refresh an entry's mtime, and the least recently used entries are evicted once
+# the cache grows past its size cap.
+
+EVICTION_TARGET_RATIO = 0.9  # evict down to 90% of the cap to avoid evicting on every write
+
+
+class RenderCache:
+    """Disk cache of rendered diagram bytes with LRU eviction and a size cap."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._entries())
+
+    @staticmethod
+    def key(code, output_format, renderer_version):
+        content = "\0".join([renderer_version, output_format, code])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return self.directory / key[:2] / key
+
+    def _entries(self):
+        return [path for path in self.directory.glob("*/*") if path.is_file() and not path.name.endswith(".tmp")]
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mark as recently used
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        with self._lock:
+            previous_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - previous_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._size <= self.max_bytes * EVICTION_TARGET_RATIO:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            for path in self._entries():
+                path.unlink(missing_ok=True)
+            self._size = 0
@@ -0,0 +1,119 @@
+import pytest
+
+from plantuml_syntax import check_block_structure, check_plantuml_syntax, split_pages
+
+VALID_DIAGRAMS = {
+    "break in a repeat loop": """@startuml
+start
+repeat
+  :read data;
+  if (end of file?) then (yes)
+    break
+  endif
+  :process data;
+repeat while (more?)
+stop
+@enduml""",
+    "rnote and hnote blocks": """@startuml
+A -> B : hello
+rnote over A
+  a note
+endrnote
+hnote over B
+  another note
+end hnote
+@enduml""",
+    "participant named Group": """@startuml
+participant Group
+Group -> B : hi
+B --> Group : ok
+@enduml""",
+    "brace in a multi-line activity label": """@startuml
+start
+:send the request
+with a {json} body;
+stop
+@enduml""",
+    "brace in a message label": """@startuml
+A -> B : POST {
+B --> A : }
+@enduml""",
+    "entity relationship arrows": """@startuml
+entity Customer {
+  *id : int
+}
+entity Order {
+  *id : int
+}
+Customer ||--o{ Order : places
+@enduml""",
+    "sequence groups": """@startuml
+alt success
+  A -> B : ok
+else failure
+  A -> B : retry
+  loop 3 times
+    A -> B : again
+  end
+end
+@enduml""",
+}
+
+
+@pytest.mark.parametrize("code", VALID_DIAGRAMS.values(), ids=VALID_DIAGRAMS.keys())
+def test_valid_diagrams_pass(code):
+    assert check_plantuml_syntax(code) == []
+    assert check_block_structure(code) == []
+
+
+@pytest.mark.parametrize("code, line", [
+    ("@startuml\nstart\nif (x?) then (yes)\n  :a;\nstop\n@enduml", 3),
+    ("@startuml\nclass A {\n  +x : int\n@enduml", 2),
+    ("@startuml\nalt ok\n  A -> B\n@enduml", 2),
+])
+def test_unclosed_blocks_are_found(code, line):
+    assert [number for number, _ in check_block_structure(code)] == [line]
+
+
+@pytest.mark.parametrize("code", [
+    "A -> B",
+    "@startuml\nA -> B\n@endmindmap",
+    "@startuml\n```\nA -> B\n@enduml",
+])
+def test_code_that_cannot_render_is_rejected(code):
+    assert check_plantuml_syntax(code)
+
+
+def page_bodies(code):
+    return [page_code.splitlines()[1:-1] for page_code, _ in split_pages(code)]
+
+
+def test_split_pages_repeats_sequence_participants():
+    code = """@startuml
+!theme aws-orange
+actor User
+participant Shop
+User -> Shop : order
+newpage Payment
+Shop -> User : invoice
+@enduml"""
+    assert page_bodies(code)[1] == ["!theme aws-orange", "actor User", "participant Shop", "title Payment",
+                                    "Shop -> User : invoice"]
+
+
+def test_split_pages_keeps_entities_on_their_own_page():
+    code = """@startuml
+skinparam linetype ortho
+entity Customer {
+  *id : int
+}
+entity Order {
+  *id : int
+}
+Customer ||--o{ Order
+newpage Catalog
+entity Product {
+  *id : int
+}
+@enduml"""
+    assert page_bodies(code)[1] == ["skinparam linetype ortho", "title Catalog", "entity Product {", "  *id : int", "}"]
@@ -0,0 +1,102 @@
+import pytest
+
+from transcript import chunk_transcript, compact_transcript, split_turns, strip_filler
+
+
+@pytest.mark.parametrize("text", [
+    "The bolt is 5 mm wide",
+    "the MM module handles ERM data",
+    "The HM Revenue export runs nightly.",
+    "The coating is 5 um thick.",
+    "Ahmed owns the umbrella account.",
+])
+def test_words_that_look_like_filler_are_kept(text):
+    assert strip_filler(text) == text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Um, so we need a refund flow.", "So we need a refund flow."),
+    ("Uh, um, the order ships next day.", "The order ships next day."),
+    ("So, uh, the admin approves.", "So, the admin approves."),
+    ("The order ships, erm, next day, hm.", "The order ships, next day."),
+])
+def test_standalone_filler_is_removed(text, expected):
+    assert strip_filler(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Let me share my screen, this mockup shows the refund approval step that finance needs.",
+     "This mockup shows the refund approval step that finance needs."),
+    ("I was on mute, so the invoice needs approval.", "So the invoice needs approval."),
+    ("Can you hear me? The invoice is sent by email.", "The invoice is sent by email."),
+])
+def test_call_logistics_keep_the_rest_of_the_sentence(text, expected):
+    assert strip_filler(text) == expected
+
+
+@pytest.mark.parametrize("text", ["Mm-hmm.", "Okay. Yeah, got it.", "Can you hear me?", "You're on mute."])
+def test_sentences_without_content_are_dropped(text):
+    assert strip_filler(text) == ""
+
+
+def test_compact_transcript_merges_turns_and_keeps_content():
+    transcript = "\n".join([
+        "0:0:1.000 --> 0:0:3.000",
+        "<v Jane Doe>Um, can you hear me?</v>",
+        "0:0:3.000 --> 0:0:6.000",
+        "<v Jane Doe>The bolt is 5 mm wide, uh, and the MM module checks it.</v>",
+        "0:0:6.000 --> 0:0:7.000",
+        "<v Sam Lee>Mm-hmm.</v>",
+        "0:0:7.000 --> 0:0:9.000",
+        "<v Sam Lee>Let me share my screen, this mockup shows the refund step.</v>",
+    ])
+    assert compact_transcript(transcript) == (
+        "Jane Doe: The bolt is 5 mm wide, and the MM module checks it.\n"
+        "Sam Lee: This mockup shows the refund step."
+    )
+
+
+def test_speech_ending_in_a_time_is_not_a_speaker_heading():
+    transcript = "\n".join([
+        "Jane Doe 0:03",
+        "We will review the checkout flow tomorrow at 10:30",
+        "and close the open tickets.",
+    ])
+    assert compact_transcript(transcript) == (
+        "Jane Doe: We will review the checkout flow tomorrow at 10:30\nand close the open tickets."
+    )
+
+
+def test_labels_stay_with_the_current_speaker():
+    transcript = "\n".join([
+        "Jane Doe: The admin approves every refund.",
+        "Note: approvals are logged.",
+        "Sam Lee: Refunds over 100 need a second approver.",
+    ])
+    assert split_turns(transcript) == [
+        "Jane Doe: The admin approves every refund.\nNote: approvals are logged.",
+        "Sam Lee: Refunds over 100 need a second approver.",
+    ]
+
+
+def test_role_style_speaker_prefixes_start_turns():
+    transcript = "\n".join([
+        "Account Manager - Mike (Side A): The shop sells used books.",
+        "CEO - Bob (Side B): Customers pay by card.",
+        "Dave (Side B): Orders ship within two days.",
+    ])
+    assert [turn.split(":")[0] for turn in split_turns(transcript)] == [
+        "Account Manager - Mike (Side A)", "CEO - Bob (Side B)", "Dave (Side B)",
+    ]
+
+
+def test_chunks_do_not_split_a_turn_at_a_label():
+    transcript = "\n".join([
+        "Sam Lee: Refunds over 100 need a second approver.",
+        "Jane Doe: The admin approves every refund.",
+        "Action item: log each approval.",
+    ])
+    assert chunk_transcript(transcript, 26) == [
+        "Sam Lee: Refunds over 100 need a second approver.",
+        "Jane Doe: The admin approves every refund.\nAction item: log each approval.",
+    ]
@@ -0,0 +1,37 @@
+import math
+import re
+
+# Offline token estimation for sizing LLM requests before they are sent.
+# This is a heuristic (no tokenizer download needed): Latin-script text averages
+# about 4 characters per token, while CJK characters are roughly one token each.
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4  # role/separator tokens added to every chat message
+REPLY_OVERHEAD_TOKENS = 3  # tokens priming the assistant reply
+
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens in a piece of text."""
+    if not text:
+        return 0
+    cjk_chars = len(CJK_PATTERN.findall(text))
+    other_chars = len(text) - cjk_chars
+    return cjk_chars + math.ceil(other_chars / CHARS_PER_TOKEN)
+
+
+def estimate_chat_tokens(messages):
+    """Estimate the prompt tokens of a list of chat messages ({"role", "content"} dicts)."""
+    total = REPLY_OVERHEAD_TOKENS
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message["content"])
+    return total
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut `text` to about `max_tokens` estimated tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Estimates are roughly proportional to length, so cut by the same ratio
+    return text[:max(int(len(text) * max_tokens / estimate_tokens(text)), 0)]
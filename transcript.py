@@ -0,0 +1,222 @@
+import re
+
+from token_estimator import estimate_tokens, truncate_to_tokens
+
+# Local preprocessing of meeting transcripts before they are sent to a model.
+# compact_transcript drops what costs tokens without carrying requirements (timestamps,
+# repeated speaker names, filler), and chunk_transcript splits a transcript into parts that
+# fit in a prompt. Parts end on speaker turns, so a turn is only cut when it is longer than a
+# whole part, and then on line breaks or sentence ends where possible.
+
+TIMESTAMP = r"\[?\d{1,2}:\d{1,2}(?::\d{1,2})?(?:[.,]\d+)?\]?"
+TIMING_LINE_PATTERN = re.compile(rf"^\s*{TIMESTAMP}(?:\s*-->\s*{TIMESTAMP})?\s*$")  # "0:0:3.120 --> 0:0:5.600"
+SPEAKER_HEADING_PATTERN = re.compile(rf"^(?P<speaker>.{{1,80}}?)\s+{TIMESTAMP}\s*$")
+VOICE_TAG_PATTERN = re.compile(r"^<v\s+(?P<speaker>[^>]+)>(?P<text>.*?)(?:</v>)?$")
+SPEAKER_PREFIX_PATTERN = re.compile(r"^(?P<speaker>[^:,\n]{1,80}):\s+(?P<text>.*)$")
+# A speaker name is a few capitalized words, optionally with a role and "(...)" parts:
+# "Jane Doe", "Account Manager - Mike (Side A)"
+NAME_WORD_PATTERN = re.compile(r"^[^\W\d_a-z][\w'’.-]*$")
+NAME_PARTICLES = {"de", "da", "del", "der", "di", "van", "von", "la", "le", "bin", "al"}
+NAME_SEPARATORS = {"-", "–", "—", "/", "&"}
+MAX_NAME_WORDS = 6
+# Capitalized words that label a line ("Note: ...") rather than name a speaker
+LABEL_WORDS = {
+    "note", "notes", "action", "action item", "action items", "todo", "to do", "decision", "question", "answer",
+    "example", "summary", "update", "agenda", "important", "warning", "reminder", "fyi", "ps", "re", "subject",
+    "topic", "next steps", "goal", "requirement", "issue", "risk", "q", "a",
+}
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+# Hesitation sounds, removed only where they stand alone: opening a sentence ("Um, the
+# order...") or between commas ("so, uh, the order"). Lowercase only, apart from the first
+# letter of a sentence, so "5 mm", "the MM module" and "HM Revenue" are kept.
+FILLER = r"(?:mm-hmm|uh-huh|u+m+|u+h+|e+r+m+|a+h+|h+m+|m+h*m+)"
+LEADING_FILLER_PATTERN = re.compile(rf"^(?:{FILLER}\b[,.!?]*\s*)+")
+INNER_FILLER_PATTERN = re.compile(rf",\s*{FILLER}(?=\s*(?:[,.!?]|$))")
+# Sentences made only of acknowledgements are dropped whole
+BACKCHANNEL_PATTERN = re.compile(
+    r"(?:(?:yeah|yep|yup|okay|ok|right|sure|cool|alright|all right|got it|i see)[\s,]*)+[.!?]*", re.IGNORECASE
+)
+# Call logistics; only the matched phrase is removed, the rest of the sentence is kept
+CALL_NOISE_PATTERN = re.compile(
+    r"can you (?:all )?(?:hear|see) (?:me|us|my screen)|(?:you're|you are|i was|i'm|i am) (?:still )?(?:on )?mute"
+    r"|let me share my screen|is my screen (?:visible|showing)|you're breaking up|sorry,? (?:i|you) (?:dropped|got cut off)",
+    re.IGNORECASE
+)
+
+def looks_like_name(text):
+    """Whether `text` reads as a speaker name rather than speech or a label such as "Note"."""
+    text = text.strip()
+    unbracketed = re.sub(r"\([^)]*\)", " ", text)
+    words = [word for word in unbracketed.split() if word not in NAME_SEPARATORS]
+    if not words or len(words) > MAX_NAME_WORDS or text.lower() in LABEL_WORDS or re.search(r"[,;!?]", unbracketed):
+        return False
+    return all(NAME_WORD_PATTERN.match(word) or word in NAME_PARTICLES for word in words)
+
+
+def is_speaker(name, speakers=()):
+    return name.strip() in speakers or looks_like_name(name)
+
+
+def turn_start(line, next_line=None, speakers=()):
+    """
+    Whether `line` can start a speaker turn: a timing line, a WebVTT voice tag, a Teams
+    "Name 0:03" heading followed by what was said, or a "Name: text" line. `speakers` are
+    names already known from voice tags and headings.
+    """
+    line = line.strip()
+    if TIMING_LINE_PATTERN.match(line) or VOICE_TAG_PATTERN.match(line):
+        return True
+    if match := SPEAKER_HEADING_PATTERN.match(line):
+        # "... tomorrow at 10:30" is speech, not a heading
+        return (looks_like_name(match["speaker"]) and next_line is not None
+                and not TIMING_LINE_PATTERN.match(next_line))
+    if match := SPEAKER_PREFIX_PATTERN.match(line):
+        return is_speaker(match["speaker"], speakers)
+    return False
+
+
+def known_speakers(lines):
+    """Speaker names from the voice tags and "Name 0:03" headings in `lines`."""
+    lines = [line for line in lines if line.strip()]
+    speakers = set()
+    for line, next_line in zip(lines, lines[1:] + [None]):
+        line = line.strip()
+        if match := VOICE_TAG_PATTERN.match(line):
+            speakers.add(match["speaker"].strip())
+        elif (match := SPEAKER_HEADING_PATTERN.match(line)) and turn_start(line, next_line):
+            speakers.add(match["speaker"].strip())
+    return speakers
+
+
+def starts_turn(line, current, next_line=None, speakers=()):
+    """Whether `line`, followed by `next_line`, starts a new turn after the lines of the `current` turn."""
+    if not current or not turn_start(line, next_line, speakers):
+        return False
+    timing_lines = next((index for index, other in enumerate(current) if not TIMING_LINE_PATTERN.match(other)),
+                        len(current))
+    body = current[timing_lines:]
+    if not body:
+        return False
+    if TIMING_LINE_PATTERN.match(line):
+        return True
+    # In a Teams cue (timing, speaker name, text) the text line after the bare name belongs to the cue
+    return not (timing_lines and len(body) == 1 and not turn_start(body[0], line, speakers))
+
+
+def split_turns(text, speakers=None):
+    """Split a transcript into speaker turns, each starting at a timestamp or speaker line."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if speakers is None:
+        speakers = known_speakers(lines)
+    turns, current = [], []
+    for line, next_line in zip(lines, lines[1:] + [None]):
+        if starts_turn(line, current, next_line, speakers):
+            turns.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        turns.append("\n".join(current))
+    return turns
+
+
+def parse_turn(turn, speakers=()):
+    """Return (speaker, text) for a turn from split_turns; speaker is None when the turn has no speaker line."""
+    lines = [line.strip() for line in turn.splitlines()]
+    timed = bool(TIMING_LINE_PATTERN.match(lines[0]))
+    lines = [line for line in lines if not TIMING_LINE_PATTERN.match(line)]
+    if not lines:
+        return None, ""
+    speaker = None
+    if match := VOICE_TAG_PATTERN.match(lines[0]):
+        speaker, lines[0] = match["speaker"], match["text"]
+    elif (match := SPEAKER_HEADING_PATTERN.match(lines[0])) and turn_start(lines[0], (lines[1:] or [None])[0]):
+        speaker, lines = match["speaker"], lines[1:]
+    elif (match := SPEAKER_PREFIX_PATTERN.match(lines[0])) and is_speaker(match["speaker"], speakers):
+        speaker, lines[0] = match["speaker"], match["text"]
+    elif timed and len(lines) > 1 and is_speaker(lines[0], speakers):
+        # Teams cue: timing line, speaker name line, then what was said
+        speaker, lines = lines[0], lines[1:]
+    return speaker and speaker.strip(), "\n".join(lines)
+
+
+def strip_sentence_filler(sentence):
+    """Remove standalone hesitation sounds and call logistics from one sentence."""
+    capitalized = sentence[:1].isupper()
+    sentence = INNER_FILLER_PATTERN.sub("", CALL_NOISE_PATTERN.sub("", sentence))
+    sentence = re.sub(r"\s+([,.!?])", r"\1", re.sub(r"\s{2,}", " ", sentence)).strip(" ,")
+    # Compare with a lowercase first letter, so "Um" matches and "MM" or "HM" don't
+    leading = LEADING_FILLER_PATTERN.match(sentence[:1].lower() + sentence[1:])
+    if leading:
+        sentence = sentence[leading.end():].lstrip(" ,")
+    return sentence[:1].upper() + sentence[1:] if capitalized else sentence
+
+
+def strip_filler(text):
+    """Remove hesitation sounds, acknowledgement-only sentences and call logistics from text."""
+    lines = []
+    for line in text.splitlines():
+        sentences = []
+        for sentence in SENTENCE_END_PATTERN.split(line):
+            sentence = strip_sentence_filler(sentence)
+            if re.search(r"\w", sentence) and not BACKCHANNEL_PATTERN.fullmatch(sentence):
+                sentences.append(sentence)
+        if sentences:
+            lines.append(" ".join(sentences))
+    return "\n".join(lines)
+
+def compact_transcript(text):
+    """
+    Rewrite a transcript as "Speaker: text" lines without timestamps and filler, merging
+    consecutive turns by the same speaker. Text without a speaker line stays with the turn
+    before it on its own line.
+    """
+    speakers = known_speakers(text.splitlines())
+    turns = []  # [speaker, text]
+    for turn in split_turns(text, speakers):
+        speaker, body = parse_turn(turn, speakers)
+        body = strip_filler(body)
+        if not body:
+            continue
+        if turns and speaker is None:
+            turns[-1][1] += "\n" + body
+        elif turns and speaker == turns[-1][0]:
+            turns[-1][1] += " " + body
+        else:
+            turns.append([speaker, body])
+    return "\n".join(f"{speaker}: {body}" if speaker else body for speaker, body in turns)
+
+
+def split_text(text, max_tokens):
+    """Split text longer than `max_tokens` estimated tokens on line breaks, sentence ends, or anywhere."""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    for pattern, separator in ((re.compile(r"\n"), "\n"), (SENTENCE_END_PATTERN, " ")):
+        parts = pattern.split(text)
+        if len(parts) > 1:
+            return pack(parts, max_tokens, separator)
+    head = truncate_to_tokens(text, max_tokens) or text[:1]
+    return [head] + split_text(text[len(head):], max_tokens)
+
+
+def pack(pieces, max_tokens, separator="\n"):
+    """Join consecutive pieces into as few chunks of at most `max_tokens` as possible, keeping their order."""
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        for part in split_text(piece, max_tokens):
+            if not part.strip():
+                continue
+            tokens = estimate_tokens(part + separator)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(separator.join(current))
+                current, current_tokens = [], 0
+            current.append(part)
+            current_tokens += tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def chunk_transcript(text, max_tokens):
+    """Split a transcript into parts of at most `max_tokens` estimated tokens on speaker turn boundaries."""
+    return pack(split_turns(text), max_tokens)